@@ -0,0 +1,224 @@
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sys
+import time
+import tracemalloc
+import pyrtl
+from main import read_blif, block_defs
+from netlistToMaki import netlist_to_ast, convert_to_debruijn, ast_to_token_ids, \
+    get_tandem_repeats_from_tokens, ir_to_racket, find_loops, Interner
+from suffixarray import suffix_array, lcp_array
+from rerollLoops import reroll_loops
+from synthNetlist import build_pyrtl
+from blifFrontend import read_blif_defs
+from netlistCleanup import cleanup_defs
+
+# Benchmark the conversion pipeline phase by phase over the bundled basejump-netlists.
+# Every BLIF is run once per --repeat for wall time (the best run is kept) and once more
+# under tracemalloc for the peak memory allocated in each phase. For each design with
+# several width variants (name_16, name_32, ...) a scaling exponent b is fitted per phase,
+# time ~ width^b, by least squares in log-log space.
+# With --baseline, exits with status 1 if a phase got slower or needs more memory than
+# the stored baseline allows (see --tolerance); --save-baseline stores the current results.
+
+BLIFS = 'basejump-netlists'
+
+PHASES = ['import', 'cleanup', 'netlist_to_ast', 'convert_to_debruijn', 'ast_to_tokens',
+          'suffix_array', 'lcp_array', 'tandem_repeats', 'ir_to_racket', 'find_loops', 'reroll_loops']
+
+# Runs the pipeline on one BLIF, calling every phase through measure(name, fn, *args).
+# With build, the netlist is built by build() (e.g. a synthNetlist design) instead of read from blif.
+# frontend 'stream' reads blif with blifFrontend.read_blif_defs().
+# With intern, the AST is hash-consed (netlistToMaki.Interner).
+# Returns the number of tokens and the loops found.
+def run_pipeline(blif, clock, measure, build=None, frontend='pyrtl', intern=False):
+    pyrtl.reset_working_block()
+    interner = Interner() if intern else None
+    if build is not None:
+        measure('import', build)
+        defs = measure('cleanup', lambda: cleanup_defs(block_defs())[0])
+    elif frontend == 'stream':
+        defs = measure('import', read_blif_defs, blif, clock)
+        defs = measure('cleanup', lambda: cleanup_defs(defs)[0])
+    else:
+        measure('import', read_blif, blif, clock)
+        defs = measure('cleanup', lambda: cleanup_defs(block_defs())[0])
+    ast = measure('netlist_to_ast', lambda: netlist_to_ast(defs, interner=interner))
+    measure('convert_to_debruijn', convert_to_debruijn, ast, interner)
+    tok, table = measure('ast_to_tokens', lambda: ast_to_token_ids(ast, interned=intern))
+    sa = measure('suffix_array', suffix_array, tok)
+    measure('lcp_array', lcp_array, tok, sa)
+    measure('tandem_repeats', lambda: get_tandem_repeats_from_tokens(tok, 'runs', table=table))
+    varMap = measure('ir_to_racket', ir_to_racket, ast, blif)
+    loops = measure('find_loops', lambda: find_loops(ast, varMap, interned=intern))
+    measure('reroll_loops', reroll_loops, ast, loops)
+    return len(tok), loops
+
+def time_phases(blif, clock, build=None, frontend='pyrtl', intern=False):
+    times = {}
+    def measure(name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        times[name] = time.perf_counter() - start
+        return result
+    tokens, loops = run_pipeline(blif, clock, measure, build, frontend, intern)
+    return times, tokens, loops
+
+# Peak bytes allocated by each phase above what was allocated when it started.
+def memory_phases(blif, clock, build=None, frontend='pyrtl', intern=False):
+    peaks = {}
+    def measure(name, fn, *args):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        peaks[name] = tracemalloc.get_traced_memory()[1] - start
+        return result
+    tracemalloc.start()
+    try:
+        run_pipeline(blif, clock, measure, build, frontend, intern)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def bench_blif(blif, clock, repeat, build=None, frontend='pyrtl', intern=False):
+    best = None
+    for _ in range(repeat):
+        times, tokens, loops = time_phases(blif, clock, build, frontend, intern)
+        best = times if best is None else {p: min(best[p], times[p]) for p in times}
+    return {'tokens': tokens, 'loops': len(loops), 'time': best,
+            'peak': memory_phases(blif, clock, build, frontend, intern)}
+
+# Benchmark entries for synthetic designs of each size in reps (see synthNetlist),
+# named synth_<reps> so that they get a scaling fit like width variants.
+def synth_benchmarks(reps, body, nest, noise):
+    return [('synth_{}'.format(r), lambda r=r: build_pyrtl(reps=r, body=body, nest=nest, noise=noise))
+            for r in reps]
+
+def split_width(name):
+    m = re.match(r'(.*)_(\d+)$', name)
+    return (m.group(1), int(m.group(2))) if m else (name, None)
+
+# Least squares slope of log(y) over log(x).
+def loglog_slope(xs, ys):
+    lx = [math.log(x) for x in xs]
+    ly = [math.log(max(y, 1e-6)) for y in ys]
+    mx = sum(lx) / len(lx)
+    my = sum(ly) / len(ly)
+    var = sum((x - mx) ** 2 for x in lx)
+    if var == 0:
+        return None
+    return sum((x - mx) * (y - my) for x, y in zip(lx, ly)) / var
+
+# {design: {phase: exponent}} for the designs with two or more widths.
+def scaling_fits(results):
+    designs = {}
+    for name, r in results.items():
+        design, width = split_width(name)
+        if width is not None:
+            designs.setdefault(design, []).append((width, r))
+    fits = {}
+    for design, variants in sorted(designs.items()):
+        if len(set(w for w, _ in variants)) < 2:
+            continue
+        widths = [w for w, _ in variants]
+        fits[design] = {p: loglog_slope(widths, [r['time'][p] for _, r in variants]) for p in PHASES}
+    return fits
+
+# Phases that regressed against the baseline: slower (or larger peak) by more than
+# tolerance, and by more than min_time seconds (min_bytes bytes) in absolute terms.
+def regressions(results, baseline, tolerance, min_time, min_bytes):
+    found = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for p in PHASES:
+            for metric, floor in (('time', min_time), ('peak', min_bytes)):
+                old = base[metric].get(p)
+                new = r[metric].get(p)
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + tolerance) and new - old > floor:
+                    found.append((name, p, metric, old, new))
+    return found
+
+def read_patterns(benchmarks_list):
+    with open(benchmarks_list) as f:
+        return [line.strip() for line in f if line.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-phase time and memory benchmark of the conversion pipeline.')
+    parser.add_argument('patterns', nargs='*',
+                        help='design name patterns (default: read from --list)')
+    parser.add_argument('--list', default='benchmarks/BENCHMARKS-SMALL',
+                        help='benchmarks list to read patterns from')
+    parser.add_argument('--clock', default='clk')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='take the best wall time of this many runs')
+    parser.add_argument('--output', default='bench-pipeline.json',
+                        help='where to write the results and scaling fits')
+    parser.add_argument('--baseline', help='fail on regressions against this stored results file')
+    parser.add_argument('--save-baseline', help='store the results as a baseline here')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown/growth over the baseline')
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='ignore time regressions smaller than this many seconds')
+    parser.add_argument('--min-bytes', type=int, default=1 << 20,
+                        help='ignore memory regressions smaller than this many bytes')
+    parser.add_argument('--frontend', default='pyrtl', choices=('pyrtl', 'stream'),
+                        help='BLIF import: pyrtl.input_from_blif, or the streaming blifFrontend')
+    parser.add_argument('--intern', action='store_true',
+                        help='share structurally equal subexpressions of the AST')
+    parser.add_argument('--synth', type=int, nargs='+',
+                        help='benchmark synthetic designs with these repetition counts instead of BLIFs')
+    parser.add_argument('--synth-body', type=int, default=4, help='gates per synthetic body')
+    parser.add_argument('--synth-nest', type=int, nargs='*', default=[], help='synthetic outer repetition counts')
+    parser.add_argument('--synth-noise', type=float, default=0.0, help='synthetic noise gate probability')
+    args = parser.parse_args()
+
+    if args.synth:
+        benchmarks = synth_benchmarks(args.synth, args.synth_body, tuple(args.synth_nest), args.synth_noise)
+    else:
+        benchmarks = []
+        for pattern in args.patterns or read_patterns(args.list):
+            pattern = pattern if pattern.endswith('*') else pattern + '*'
+            for blif in sorted(glob.glob(os.path.join(BLIFS, pattern + '.blif'))):
+                benchmarks.append((blif, None))
+
+    results = {}
+    for blif, build in benchmarks:
+        name = blif if build else os.path.basename(blif)[:-5]
+        try:
+            results[name] = bench_blif(blif, args.clock, max(1, args.repeat), build, args.frontend,
+                                       args.intern)
+        except Exception as e:
+            print('{:<70} failed: {}'.format(name, e), file=sys.stderr)
+            continue
+        r = results[name]
+        print('{:<70} {:>8} tokens {:>9.3f}s {:>9.1f} MiB peak'.format(
+            name, r['tokens'], sum(r['time'].values()), max(r['peak'].values()) / (1 << 20)))
+        for p in PHASES:
+            print('    {:<22} {:>10.4f}s {:>10.1f} KiB'.format(p, r['time'][p], r['peak'][p] / 1024))
+
+    fits = scaling_fits(results)
+    for design, fit in fits.items():
+        print('{} scaling exponents (time ~ width^b):'.format(design))
+        print('    ' + ', '.join('{} {:.2f}'.format(p, b) for p, b in fit.items() if b is not None))
+
+    with open(args.output, 'w') as f:
+        json.dump({'results': results, 'fits': fits}, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance, args.min_time, args.min_bytes)
+        for name, p, metric, old, new in found:
+            print('REGRESSION {} {} {}: {:.4g} -> {:.4g}'.format(name, p, metric, old, new))
+        if found:
+            sys.exit(1)
@@ -0,0 +1,83 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import pyrtl
+from main import read_blif, block_defs, block_to_ast
+from netlistCleanup import cleanup_defs
+from blifFrontend import read_blif_defs
+from netlistToMaki import ast_to_token_ids, get_tandem_repeats_from_tokens
+
+# Benchmark the tandem repeat stage of loop identification.
+# For each design pattern (as in the benchmarks/ lists), every matching BLIF
+# (e.g. the _16/_32/_64 width variants) is converted to an interned Maki token stream,
+# and get_tandem_repeats_from_tokens() is timed with each engine
+# (the bounded engine with --max-period, and checked against the runs engine).
+
+BLIFS = 'basejump-netlists'
+
+# frontend 'stream' reads blif with blifFrontend.read_blif_defs().
+def tokens_for(blif, clock, frontend='pyrtl'):
+    pyrtl.reset_working_block()
+    if frontend == 'stream':
+        defs = read_blif_defs(blif, clock)
+    else:
+        read_blif(blif, clock)
+        defs = block_defs()
+    return ast_to_token_ids(block_to_ast(defs=cleanup_defs(defs)[0]))
+
+# best-of-n wall time of one engine over a token stream
+def time_engine(tok, table, engine, repeat, max_period=128):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = get_tandem_repeats_from_tokens(tok, engine, table=table, max_period=max_period)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def read_patterns(benchmarks_list):
+    with open(benchmarks_list) as f:
+        return [line.strip() for line in f if line.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare tandem repeat engines across design width variants.')
+    parser.add_argument('patterns', nargs='*',
+                        help='design name patterns (default: read from --list)')
+    parser.add_argument('--list', default='benchmarks/BENCHMARKS-SMALL-MEDIUM-LARGE',
+                        help='benchmarks list to read patterns from')
+    parser.add_argument('--clock', default='clk')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='take the best of this many runs per engine')
+    parser.add_argument('--naive-limit', type=int, default=2000,
+                        help='skip the naive engine on token streams longer than this')
+    parser.add_argument('--max-period', type=int, default=128,
+                        help='longest repeat the bounded engine looks for')
+    parser.add_argument('--frontend', default='pyrtl', choices=('pyrtl', 'stream'),
+                        help='BLIF import: pyrtl.input_from_blif, or the streaming blifFrontend')
+    args = parser.parse_args()
+
+    patterns = args.patterns or read_patterns(args.list)
+    print('{:<70} {:>8} {:>10} {:>10} {:>11} {:>9}  {:<9}  {}'.format(
+        'design', 'tokens', 'naive (s)', 'runs (s)', 'bounded (s)', 'speedup', 'same loop', 'bounded same'))
+    for pattern in patterns:
+        pattern = pattern if pattern.endswith('*') else pattern + '*'
+        for blif in sorted(glob.glob(os.path.join(BLIFS, pattern + '.blif'))):
+            name = os.path.basename(blif)[:-5]
+            try:
+                tok, table = tokens_for(blif, args.clock, args.frontend)
+            except Exception as e:
+                print('{:<70} failed to convert: {}'.format(name, e), file=sys.stderr)
+                continue
+            runs_time, runs_result = time_engine(tok, table, 'runs', args.repeat)
+            bounded_time, bounded_result = time_engine(tok, table, 'bounded', args.repeat, args.max_period)
+            if len(tok) > args.naive_limit:
+                print('{:<70} {:>8} {:>10} {:>10.4f} {:>11.4f} {:>9}  {:<9}  {}'.format(
+                    name, len(tok), 'skipped', runs_time, bounded_time, '-', '-', bounded_result == runs_result))
+                continue
+            naive_time, naive_result = time_engine(tok, table, 'naive', args.repeat)
+            print('{:<70} {:>8} {:>10.4f} {:>10.4f} {:>11.4f} {:>8.1f}x  {:<9}  {}'.format(
+                name, len(tok), naive_time, runs_time, bounded_time,
+                naive_time / runs_time if runs_time else float('inf'),
+                str(naive_result == runs_result), bounded_result == runs_result))
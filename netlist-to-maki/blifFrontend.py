@@ -0,0 +1,447 @@
+import argparse
+import random
+import re
+import sys
+import time
+import pyrtl
+
+# Streaming BLIF front end: builds the def map netlist_to_ast() takes (see main.block_defs())
+# straight from the BLIF, without pyrtl.input_from_blif(), combine_slice_concats() or
+# net_connections(). Handles the flattened Yosys output of the bundled netlists: .names covers,
+# .latch registers and the internal cells in CELL_OPS as .subckt instances with bit-blasted ports.
+#
+# The file is read line by line into compact command records; nets are only built once every
+# BLIF signal is known, so a signal may be used before the command that drives it.
+# Buffers (".names a b" / "1 1") become aliases instead of nets, and the bits of a cell
+# operand are combined while it is built: consecutive bits of one wire become that wire or a
+# single select, constant bits a single Const, and anything else one concat of those pieces.
+# Cell operands are zero-extended/truncated to the widths the cell needs (signedness is not
+# recorded in the BLIF, so all cells are taken as unsigned).
+#
+# Wires are BlifWire objects with the name/bitwidth/_code/str() of the PyRTL wires they stand
+# for (tmpN, const_N_val, Input/Output port names) and nets are pyrtl.LogicNet tuples, so
+# netlist_to_ast() treats both front ends the same. check_equivalence() simulates the netlist
+# from both front ends (the streamed one cleaned up) on the same random inputs and compares their outputs.
+
+# Yosys cell -> PyRTL net op ($mux, $shl/$shr and $dff are built from 'x' and 'r' nets)
+CELL_OPS = {'$and': '&', '$or': '|', '$xor': '^', '$not': '~', '$add': '+', '$sub': '-',
+            '$eq': '=', '$lt': '<', '$gt': '>', '$mux': 'x', '$shl': 'x', '$shr': 'x', '$dff': 'r'}
+
+# single output covers PyRTL imports as one gate (see pyrtl.input_from_blif)
+COVER_OPS = {('11 1',): '&', ('1- 1', '-1 1'): '|', ('10 1', '01 1'): '^'}
+
+class BlifWire:
+    __slots__ = ('name', 'bitwidth', '_code', 'val')
+
+    def __init__(self, name, bitwidth, code='W', val=0):
+        self.name = name
+        self.bitwidth = bitwidth
+        self._code = code
+        self.val = val
+
+    def __str__(self):
+        return '{}/{}{}'.format(self.name, self.bitwidth, self._code)
+
+    __repr__ = __str__
+
+# Yields the BLIF statements of f as token lists, joining '\' continued lines and dropping comments.
+def blif_statements(f):
+    pending = []
+    for line in f:
+        line = line.split('#', 1)[0].rstrip()
+        if line.endswith('\\'):
+            pending += line[:-1].split()
+            continue
+        tokens = pending + line.split()
+        pending = []
+        if tokens:
+            yield tokens
+
+# Splits 'name[i]' into ('name', i); a name without an index is bit 0 of a 1-bit port.
+def port_bit(name):
+    m = re.match(r'(.*)\[([0-9]+)\]$', name)
+    return (m.group(1), int(m.group(2))) if m else (name, None)
+
+# Parses a flattened BLIF model into
+#   (inputs, outputs, commands)
+# with commands ('names', signals, cover rows), ('latch', d, q, init) or
+# ('cell', type, {port: [signal per bit, least significant first]}).
+def parse_blif(f):
+    inputs, outputs, commands = [], [], []
+    models = 0
+    cover = None
+    for tokens in blif_statements(f):
+        keyword = tokens[0]
+        if not keyword.startswith('.'):
+            if cover is None:
+                raise ValueError('cover row outside of .names: ' + ' '.join(tokens))
+            cover.append(' '.join(tokens))
+            continue
+        cover = None
+        if keyword == '.model':
+            models += 1
+            if models > 1:
+                raise ValueError('only flattened BLIF (a single .model) is supported')
+        elif keyword == '.inputs':
+            inputs += tokens[1:]
+        elif keyword == '.outputs':
+            outputs += tokens[1:]
+        elif keyword == '.names':
+            cover = []
+            commands.append(('names', tokens[1:], cover))
+        elif keyword == '.latch':
+            init = tokens[5] if len(tokens) > 5 else '3'
+            commands.append(('latch', tokens[1], tokens[2], init))
+        elif keyword == '.subckt':
+            if tokens[1] not in CELL_OPS:
+                raise ValueError('unsupported cell: ' + tokens[1])
+            ports = {}
+            for formal in tokens[2:]:
+                name, signal = formal.split('=', 1)
+                port, bit = port_bit(name)
+                ports.setdefault(port, []).append((bit or 0, signal))
+            commands.append(('cell', tokens[1], {p: [s for _, s in sorted(bits)] for p, bits in ports.items()}))
+        elif keyword == '.end':
+            continue
+        else:
+            raise ValueError('unsupported BLIF statement: ' + keyword)
+    return inputs, outputs, commands
+
+# Builds the def map of the BLIF in file f: {wire: net}, with Input and Const wires
+# defined by themselves (as net_connections(include_virtual_nodes=True) has them).
+def blif_to_defs(f, clock='clk'):
+    inputs, outputs, commands = parse_blif(f)
+    defs = {}
+    counter = [0]
+    consts = {}
+    values = {}
+    clocks = {clock}
+
+    def new_wire(bitwidth, code='W'):
+        w = BlifWire('tmp' + str(counter[0]), bitwidth, code)
+        counter[0] += 1
+        return w
+
+    def const(val, bitwidth):
+        if (val, bitwidth) not in consts:
+            c = BlifWire('const_{}_{}'.format(len(consts), val), bitwidth, 'C', val)
+            consts[(val, bitwidth)] = c
+            defs[c] = c
+        return consts[(val, bitwidth)]
+
+    def net(op, args, dest, param=None):
+        defs[dest] = pyrtl.LogicNet(op, param, tuple(args), (dest,))
+        return dest
+
+    # the wire holding bits (each (wire, index) or a constant 0/1), least significant first
+    def value(bits):
+        key = tuple(bits)
+        if key in values:
+            return values[key]
+        pieces = []
+        i = 0
+        while i < len(bits):
+            j = i + 1
+            if isinstance(bits[i], tuple):
+                w, lo = bits[i]
+                while j < len(bits) and bits[j] == (w, lo + j - i):
+                    j += 1
+                if lo == 0 and j - i == w.bitwidth:
+                    pieces.append(w)
+                else:
+                    pieces.append(net('s', [w], new_wire(j - i), tuple(range(lo, lo + j - i))))
+            else:
+                while j < len(bits) and not isinstance(bits[j], tuple):
+                    j += 1
+                pieces.append(const(sum(b << k for k, b in enumerate(bits[i:j])), j - i))
+            i = j
+        v = pieces[0] if len(pieces) == 1 else net('c', reversed(pieces), new_wire(len(bits)))
+        values[key] = v
+        return v
+
+    def extend(bits, width):
+        return bits[:width] + [0] * (width - len(bits))
+
+    def bits_of(w):
+        return [(w, i) for i in range(w.bitwidth)]
+
+    # signal name -> bit (or the name of the signal it buffers)
+    source = {}
+    vectors = {}
+    for name in inputs:
+        port, index = port_bit(name)
+        if port not in clocks:
+            vectors.setdefault(port, []).append((index, name))
+    for port, bits in vectors.items():
+        w = BlifWire(port, len(bits), 'I')
+        defs[w] = w
+        for index, name in bits:
+            source[name] = (w, index or 0)
+
+    # allocate the wire every command drives, so that signals resolve before any net is built
+    driven = []
+    for cmd in commands:
+        if cmd[0] == 'names':
+            signals, cover = cmd[1], cmd[2]
+            y = signals[-1]
+            if len(signals) == 1:
+                source[y] = 1 if cover == ['1'] else 0
+            elif len(signals) == 2 and cover == ['1 1']:
+                if signals[0] in clocks:
+                    clocks.add(y)
+                else:
+                    source[y] = signals[0]
+            else:
+                w = new_wire(1)
+                source[y] = (w, 0)
+                driven.append((cmd, w))
+        elif cmd[0] == 'latch':
+            w = new_wire(1, 'R')
+            w.val = 1 if cmd[3] == '1' else 0
+            source[cmd[2]] = (w, 0)
+            driven.append((cmd, w))
+        else:
+            kind, ports = cmd[1], cmd[2]
+            if kind == '$dff':
+                out = ports['Q']
+                w = new_wire(len(out), 'R')
+            else:
+                out = ports['Y']
+                a, b = len(ports['A']), len(ports.get('B', ()))
+                if kind in ('$add', '$sub'):
+                    w = new_wire(max(a, b) + 1)
+                elif kind in ('$eq', '$lt', '$gt'):
+                    w = new_wire(1)
+                elif kind in ('$shl', '$shr'):
+                    w = new_wire(max(a, len(out)))
+                else:
+                    w = new_wire(len(out))
+            for signal, bit in zip(out, extend(bits_of(w), len(out))):
+                source[signal] = bit
+            driven.append((cmd, w))
+
+    def bit(signal):
+        seen = 0
+        b = source.get(signal)
+        while isinstance(b, str):
+            seen += 1
+            if seen > len(source):
+                raise ValueError('buffer loop through ' + signal)
+            b = source.get(b)
+        if b is None:
+            raise ValueError('undriven signal: ' + signal)
+        return b
+
+    def operand(signals, width=None):
+        bits = [bit(s) for s in signals]
+        return value(bits if width is None else extend(bits, width))
+
+    # one bit OR of AND terms for a general single output cover (only on-sets are supported)
+    def sum_of_products(signals, cover):
+        terms = []
+        for row in cover:
+            plane, out = row.split() if ' ' in row else (row, None)
+            if out != '1':
+                raise ValueError('unsupported cover row: ' + row)
+            literals = []
+            for signal, v in zip(signals, plane):
+                if v == '-':
+                    continue
+                lit = operand([signal])
+                literals.append(lit if v == '1' else net('~', [lit], new_wire(1)))
+            term = literals[0] if literals else const(1, 1)
+            for lit in literals[1:]:
+                term = net('&', [term, lit], new_wire(1))
+            terms.append(term)
+        if not terms:
+            return const(0, 1)
+        result = terms[0]
+        for t in terms[1:]:
+            result = net('|', [result, t], new_wire(1))
+        return result
+
+    for cmd, w in driven:
+        if cmd[0] == 'names':
+            signals, cover = cmd[1], cmd[2]
+            op = COVER_OPS.get(tuple(cover))
+            if len(signals) == 3 and op:
+                net(op, [operand(signals[:1]), operand(signals[1:2])], w)
+            elif len(signals) == 2 and cover == ['0 1']:
+                net('~', [operand(signals[:1])], w)
+            else:
+                net('w', [sum_of_products(signals[:-1], cover)], w)
+        elif cmd[0] == 'latch':
+            net('r', [operand([cmd[1]])], w)
+        else:
+            kind, ports = cmd[1], cmd[2]
+            if kind == '$dff':
+                net('r', [operand(ports['D'], w.bitwidth)], w)
+            elif kind in ('$and', '$or', '$xor'):
+                net(CELL_OPS[kind], [operand(ports['A'], w.bitwidth), operand(ports['B'], w.bitwidth)], w)
+            elif kind == '$not':
+                net('~', [operand(ports['A'], w.bitwidth)], w)
+            elif kind in ('$add', '$sub', '$eq', '$lt', '$gt'):
+                n = max(len(ports['A']), len(ports['B']))
+                net(CELL_OPS[kind], [operand(ports['A'], n), operand(ports['B'], n)], w)
+            elif kind == '$mux':
+                net('x', [operand(ports['S']), operand(ports['A'], w.bitwidth), operand(ports['B'], w.bitwidth)], w)
+            else:
+                # barrel shifter, one mux stage per bit of the shift amount
+                n = w.bitwidth
+                cur = extend([bit(s) for s in ports['A']], n)
+                shift = ports['B']
+                for k, s in enumerate(shift):
+                    amount = min(1 << k, n)
+                    moved = [0] * amount + cur[:n - amount] if kind == '$shl' else cur[amount:] + [0] * amount
+                    stage = w if k == len(shift) - 1 else new_wire(n)
+                    net('x', [operand([s]), value(cur), value(moved)], stage)
+                    cur = bits_of(stage)
+                if not shift:
+                    net('w', [value(cur)], w)
+
+    vectors = {}
+    for name in outputs:
+        port, index = port_bit(name)
+        vectors.setdefault(port, []).append((index or 0, name))
+    for port, bits in vectors.items():
+        out = BlifWire(port, len(bits), 'O')
+        net('w', [operand([name for _, name in sorted(bits)])], out)
+    return defs
+
+def read_blif_defs(bench, clock='clk'):
+    with open(bench) as f:
+        return blif_to_defs(f, clock)
+
+# Cycle-by-cycle simulation of a def map: stimulus is a list of {input name: value}.
+# Registers start at their init value (BlifWire.val, or the PyRTL reset_value, else 0).
+# Returns a list of {output name: value}.
+def simulate_defs(defs, stimulus):
+    comb = []
+    regs = []
+    users = {}
+    pending = {}
+    for w, n in defs.items():
+        if w._code in 'IC':
+            continue
+        if n.op == 'r':
+            regs.append((w, n))
+            continue
+        comb.append((w, n))
+        pending[w] = 0
+        for a in set(n.args):
+            if a in defs and a._code not in 'ICR' and defs[a].op != 'r':
+                users.setdefault(a, []).append(w)
+                pending[w] += 1
+    order = [w for w, _ in comb if not pending[w]]
+    for w in order:
+        for u in users.get(w, ()):
+            pending[u] -= 1
+            if not pending[u]:
+                order.append(u)
+    if len(order) < len(comb):
+        raise ValueError('combinational loop')
+
+    state = {w: w.val if isinstance(w, BlifWire) else w.reset_value or 0 for w, _ in regs}
+    results = []
+    for inputs in stimulus:
+        vals = dict(state)
+        for w in defs:
+            if w._code == 'I':
+                vals[w] = inputs[w.name]
+            elif w._code == 'C':
+                vals[w] = w.val
+        for w in order:
+            n = defs[w]
+            vals[w] = eval_net(n, [vals[a] for a in n.args], n.args) & ((1 << w.bitwidth) - 1)
+        results.append({w.name: vals[w] for w in defs if w._code == 'O'})
+        state = {w: vals[n.args[0]] & ((1 << w.bitwidth) - 1) for w, n in regs}
+    return results
+
+def eval_net(n, v, args):
+    op = n.op
+    if op == 'w':
+        return v[0]
+    if op == '~':
+        return ~v[0]
+    if op == '&':
+        return v[0] & v[1]
+    if op == '|':
+        return v[0] | v[1]
+    if op == '^':
+        return v[0] ^ v[1]
+    if op == 'n':
+        return ~(v[0] & v[1])
+    if op == '+':
+        return v[0] + v[1]
+    if op == '-':
+        return v[0] - v[1]
+    if op == '*':
+        return v[0] * v[1]
+    if op == '=':
+        return int(v[0] == v[1])
+    if op == '<':
+        return int(v[0] < v[1])
+    if op == '>':
+        return int(v[0] > v[1])
+    if op == 'x':
+        return v[2] if v[0] else v[1]
+    if op == 's':
+        return sum(((v[0] >> i) & 1) << k for k, i in enumerate(n.op_param))
+    if op == 'c':
+        result = 0
+        for a, x in zip(args, v):
+            result = (result << a.bitwidth) | x
+        return result
+    raise ValueError('cannot simulate op: ' + op)
+
+# Imports bench with both front ends and simulates them for cycles cycles on the same random
+# inputs: the PyRTL import as it is read, and the streamed def map after
+# netlistCleanup.cleanup_defs(), as the pipeline converts it.
+# Returns the mismatches as (cycle, output, PyRTL value, streamed value).
+def check_equivalence(bench, clock='clk', cycles=32, seed=0):
+    from main import read_blif  # main imports this module
+    from netlistCleanup import cleanup_defs  # and so does netlistCleanup
+
+    defs = read_blif_defs(bench, clock)
+    rng = random.Random(seed)
+    ports = sorted((w.name, w.bitwidth) for w in defs if w._code == 'I')
+    stimulus = [{name: rng.getrandbits(width) for name, width in ports} for _ in range(cycles)]
+    streamed = simulate_defs(cleanup_defs(defs)[0], stimulus)
+
+    pyrtl.reset_working_block()
+    read_blif(bench, clock)
+    sim = pyrtl.Simulation()
+    mismatches = []
+    for cycle, inputs in enumerate(stimulus):
+        sim.step({name: inputs[name] for name, _ in ports})
+        for name, got in sorted(streamed[cycle].items()):
+            expected = sim.inspect(name)
+            if expected != got:
+                mismatches.append((cycle, name, expected, got))
+    return mismatches
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the streaming BLIF front end against the PyRTL import.')
+    parser.add_argument('blifs', nargs='+')
+    parser.add_argument('--clock', default='clk')
+    parser.add_argument('--cycles', type=int, default=32, help='random input cycles to simulate')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    for blif in args.blifs:
+        start = time.perf_counter()
+        defs = read_blif_defs(blif, args.clock)
+        elapsed = time.perf_counter() - start
+        try:
+            mismatches = check_equivalence(blif, args.clock, args.cycles, args.seed)
+        except Exception as e:
+            print('{:<70} error: {}'.format(blif, e))
+            failed = True
+            continue
+        print('{:<70} {:>8} nets {:>8.3f}s {}'.format(
+            blif, len(defs), elapsed, 'ok' if not mismatches else '{} mismatches'.format(len(mismatches))))
+        for cycle, name, expected, got in mismatches[:10]:
+            print('    cycle {} {}: pyrtl {} streamed {}'.format(cycle, name, expected, got))
+        failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,23 @@
+import time
+
+# Cooperative time budget for a pipeline run. Long running passes take an optional
+# Deadline and check expired() between units of work; once it has expired they stop and
+# return what they have so far (e.g. the loops found up to then). The first check that
+# finds the deadline expired is recorded in exhausted, so callers can tell the result is partial.
+# Deadline() (no seconds) never expires.
+class Deadline:
+    def __init__(self, seconds=None):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.exhausted = None
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self, where='unknown'):
+        if self.expires is None or time.monotonic() < self.expires:
+            return False
+        if self.exhausted is None:
+            self.exhausted = where
+        return True
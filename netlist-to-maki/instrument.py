@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+import cProfile
+import json
+import pstats
+import time
+
+# Instrumentation of one pipeline run: wall time per phase (seconds, summed over repeated
+# phases), counts (wires, nets, commands, tokens, loop_id iterations, ...) and other
+# facts (e.g. whether the netlist cache was hit). Serialized with to_json().
+class Trace:
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        self.info = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def set_count(self, name, n):
+        self.counts[name] = n
+
+    def as_dict(self):
+        return {'phases': self.phases, 'counts': self.counts, 'info': self.info}
+
+    def to_json(self, f):
+        json.dump(self.as_dict(), f, indent=2)
+
+# Runs fn(*args) under cProfile; writes the raw stats to path (for pstats/snakeviz)
+# and the top functions by cumulative time to path + '.txt'.
+def profiled(path, fn, *args, **kwargs):
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(fn, *args, **kwargs)
+    finally:
+        profile.dump_stats(path)
+        with open(path + '.txt', 'w') as f:
+            pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(50)
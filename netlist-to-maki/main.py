@@ -1,84 +1,226 @@
 from collections import defaultdict
+import argparse
 import pyrtl
 import copy
 import math
+import os
 import pyrtl
 import sys
-import signal
-from netlistToMaki import netlist_to_ast, convert_to_debruijn, ir_to_racket, find_loops
+import time
+from netlistToMaki import netlist_to_ast, convert_to_debruijn, ir_to_racket, find_loops, write_maki, ForCmd, \
+        find_loop_hierarchy, hierarchy_loops, Interner
 from rerollLoops import reroll_loops
+from netlistCache import NetlistCache
+from instrument import Trace, profiled
+from budget import Deadline
+from blifFrontend import read_blif_defs
+from netlistCleanup import cleanup_defs
 
-# Given a PyRTL netlist (bench),
-# translate it to Maki AST and run loop identification over it (find_loops()).
-# Finally, write the concrete Maki IR with loop candidates annotated to a file.
-def do_analysis(bench, format):
+# Results file name for a BLIF: its basename with the 'blif' extension replaced by ext.
+def result_name(bench, ext='txt'):
+    return os.path.basename(bench)[:-4] + ext
+
+# The PyRTL working block's nets keyed by the wire they define (memory writes by memory id).
+def block_defs():
     defs, uses = pyrtl.working_block().net_connections(include_virtual_nodes=True)
     memwrites = dict()
     for x in pyrtl.working_block().logic:
         if x.op == '@':
             memwrites[x.op_param[0]] = x
-    defs = {**defs, **memwrites}
+    return {**defs, **memwrites}
 
-    og_netlist = netlist_to_ast(defs)
-    convert_to_debruijn(og_netlist)
+# Translate the PyRTL working block (or the def map defs, see blifFrontend) to Maki AST with De Bruijn indices.
+# With intern, equal subexpressions share one node (netlistToMaki.Interner); the number of
+# distinct interned nodes is recorded as the interned_nodes count in trace, if given.
+def block_to_ast(deadline=None, defs=None, intern=False, trace=None):
+    interner = Interner() if intern else None
+    og_netlist = netlist_to_ast(block_defs() if defs is None else defs, deadline=deadline, interner=interner)
+    convert_to_debruijn(og_netlist, interner)
+    if interner is not None and trace is not None:
+        trace.set_count('interned_nodes', len(interner))
+    return og_netlist
+
+# Given a PyRTL netlist (bench),
+# translate it to Maki AST and run loop identification over it (find_loops()).
+# Finally, write the concrete Maki IR with loop candidates annotated to a file.
+# Phase times and counts (commands, loops found and applied, ...) are recorded in trace, if given.
+# og_netlist skips the conversion with an already converted AST (e.g. from the netlist cache).
+# With a deadline (budget.Deadline), the conversion and loop identification stop early once it
+# expires and the partial results are written; trace.info['budget_exhausted'] names the phase.
+# loop_engine is the find_loops() engine; with 'hierarchy' the loop hierarchy from
+# find_loop_hierarchy() is handed to reroll_loops(); max_period bounds the loop bodies of the
+# 'bounded' engine, and with a window of commands loop identification is streamed (see find_loops()).
+# intern marks an og_netlist built with interning (see block_to_ast()).
+def do_analysis(bench, format, trace=None, og_netlist=None, deadline=None, loop_engine='runs', max_period=128,
+                window=None, intern=False):
+    trace = Trace() if trace is None else trace
+    if og_netlist is None:
+        with trace.phase('to_ast'):
+            og_netlist = block_to_ast(deadline, intern=intern)
+    trace.set_count('commands', len(og_netlist.cmds))
     # ir = copy.deepcopy(og_netlist)
-    varMap = ir_to_racket(og_netlist, bench)
+    with trace.phase('to_racket'):
+        varMap = ir_to_racket(og_netlist, bench)
 
-    loops = find_loops(og_netlist, varMap)
+    with trace.phase('find_loops'):
+        if loop_engine == 'hierarchy':
+            hierarchy = find_loop_hierarchy(og_netlist, varMap, trace=trace, deadline=deadline, window=window,
+                                            max_period=max_period, interned=intern)
+            loops = hierarchy_loops(hierarchy)
+        else:
+            loops = find_loops(og_netlist, varMap, loop_engine, trace=trace, deadline=deadline,
+                               max_period=max_period, window=window, interned=intern)
     # Returns (start-of-loop, length-of-rerolled-loop-body, number-of-repeats)
-    
-    with open('results/' + bench[18:-4] + 'txt', 'w') as f:
-        # f.write("wires: {}, nets: {}".format(len(pyrtl.working_block().wirevector_set), len(pyrtl.working_block().logic)) + "\n")
-        f.write(str(og_netlist))
-        f.write('\n' + str(loops))
+    trace.set_count('loops_found', len(loops))
 
-    rerolled_netlist = reroll_loops(og_netlist, loops)
+    with trace.phase('write'):
+        with open('results/' + result_name(bench), 'w') as f:
+            # f.write("wires: {}, nets: {}".format(len(pyrtl.working_block().wirevector_set), len(pyrtl.working_block().logic)) + "\n")
+            write_maki(og_netlist, f)
+            f.write('\n' + str(loops))
 
-    with open('results_rerolled/' + bench[18:-4] + 'txt', 'w') as f:
-        # f.write("wires: {}, nets: {}".format(len(pyrtl.working_block().wirevector_set), len(pyrtl.working_block().logic)) + "\n")
-        f.write(str(rerolled_netlist))
+    with trace.phase('reroll'):
+        rerolled_netlist = reroll_loops(og_netlist, hierarchy if loop_engine == 'hierarchy' else loops)
+    if rerolled_netlist is not None:
+        trace.set_count('loops_applied', count_loops(rerolled_netlist))
 
+        with trace.phase('write_rerolled'):
+            with open('results_rerolled/' + result_name(bench), 'w') as f:
+                # f.write("wires: {}, nets: {}".format(len(pyrtl.working_block().wirevector_set), len(pyrtl.working_block().logic)) + "\n")
+                write_maki(rerolled_netlist, f)
+
+    if deadline is not None and deadline.exhausted:
+        trace.info['budget_exhausted'] = deadline.exhausted
     return og_netlist
 
-# Given a BLIF file, import the netlist into PyRTL,
-# run some optimizations over it to remove undriven/unused wires,
-# and finally start the loop identification process (do_analysis()).
-def run_benchmark(bench, clock, format):
+# Number of loops in a rerolled program, nested loops included.
+def count_loops(block):
+    return sum(1 + count_loops(c.body) for c in block.cmds if isinstance(c, ForCmd))
+
+# Given a BLIF file, import the netlist into the PyRTL working block.
+def read_blif(bench, clock):
     with open(bench) as f:
         blif = f.read()
     pyrtl.input_from_blif(blif, clock_name=clock)
 
+# Removes the wires no net of the PyRTL working block drives or reads, then combines its
+# slices and concats; returns the number of wires removed.
+# This is the cleanup the pipeline ran before netlistCleanup.cleanup_defs(), kept as --cleanup pyrtl.
+def clean_netlist():
     srcs, dsts = pyrtl.working_block().net_connections()
-    dest_set = set(srcs.keys())
-    arg_set = set(dsts.keys())
-    full_set = dest_set | arg_set
-    connected_minus_allwires = full_set.difference(pyrtl.working_block().wirevector_set)
+    full_set = set(srcs.keys()) | set(dsts.keys())
     all_input_and_consts = pyrtl.working_block().wirevector_subset((pyrtl.Input, pyrtl.Const))
     allwires_minus_connected = pyrtl.working_block().wirevector_set.difference(full_set)
     allwires_minus_connected = allwires_minus_connected.difference(all_input_and_consts)
     for w in allwires_minus_connected:
-        print("not",w)
         pyrtl.working_block().remove_wirevector(w)
 
-    #print(pyrtl.working_block())
-    pyrtl.combine_slice_concats()
-    return do_analysis(bench, format)
+    # only the blif-cells PyRTL fork (see the Dockerfile) has combine_slice_concats
+    if hasattr(pyrtl, 'combine_slice_concats'):
+        pyrtl.combine_slice_concats()
+    return len(allwires_minus_connected)
+
+# Given a BLIF file, import the netlist and clean up its definitions (netlistCleanup.cleanup_defs(),
+# which records what it removed as cleanup_* counts), and finally start the loop identification
+# process (do_analysis()).
+# cleanup 'pyrtl' cleans the PyRTL working block with clean_netlist() instead (frontend 'pyrtl' only).
+# With a NetlistCache, a BLIF converted before (same contents, clock, front end, cleanup, interning and converter)
+# skips the import and conversion; trace.info['cache'] records 'hit' or 'miss'.
+# With profile, the run is profiled with cProfile into results/<name>.prof (see instrument.profiled()).
+# The deadline (budget.Deadline) is passed on to do_analysis(); a netlist whose conversion
+# ran out of budget is not cached.
+# frontend 'stream' builds the def map with blifFrontend.read_blif_defs() instead of importing into PyRTL.
+# intern hash-conses the AST's subexpressions (see block_to_ast()).
+def run_benchmark(bench, clock, format, trace=None, cache=None, profile=False, deadline=None, loop_engine='runs',
+                  frontend='pyrtl', intern=False, max_period=128, window=None, cleanup='defs'):
+    if cleanup == 'pyrtl' and frontend != 'pyrtl':
+        raise ValueError("cleanup 'pyrtl' cleans the PyRTL working block, use frontend 'pyrtl'")
+    trace = Trace() if trace is None else trace
+    if profile:
+        return profiled('results/' + result_name(bench, 'prof'), run_benchmark, bench, clock, format,
+                        trace, cache, False, deadline, loop_engine, frontend, intern, max_period, window, cleanup)
+    og_netlist = None
+    if cache is not None:
+        with open(bench, 'rb') as f:
+            key = cache.key(f.read(), clock, frontend, intern, cleanup)
+        og_netlist = cache.load(key)
+        trace.info['cache'] = 'miss' if og_netlist is None else 'hit'
+    if og_netlist is None:
+        with trace.phase('import'):
+            if frontend == 'stream':
+                defs = read_blif_defs(bench, clock)
+            else:
+                read_blif(bench, clock)
+                defs = block_defs()
+        if frontend == 'stream':
+            trace.set_count('wires', len(defs))
+            trace.set_count('nets', sum(1 for w, n in defs.items() if n is not w))
+        else:
+            trace.set_count('wires', len(pyrtl.working_block().wirevector_set))
+            trace.set_count('nets', len(pyrtl.working_block().logic))
+        with trace.phase('cleanup'):
+            if cleanup == 'pyrtl':
+                removed = {'removed_wires': clean_netlist()}
+                defs = block_defs()
+            else:
+                defs, removed = cleanup_defs(defs)
+        for name, n in removed.items():
+            trace.set_count('cleanup_' + name, n)
+        with trace.phase('to_ast'):
+            og_netlist = block_to_ast(deadline, defs, intern, trace)
+        if cache is not None and not (deadline is not None and deadline.exhausted):
+            cache.store(key, og_netlist)
+    return do_analysis(bench, format, trace, og_netlist, deadline, loop_engine, max_period, window, intern)
 
 if __name__ == '__main__':
-    if len(sys.argv) - 1 < 2:
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--cache-dir', help='cache converted netlists in this directory')
+    options.add_argument('--cache-size', type=int, default=1024, help='cache size limit in MiB')
+    options.add_argument('--trace', action='store_true', help='write a JSON trace to results/<name>.trace.json')
+    options.add_argument('--profile', action='store_true', help='write cProfile stats to results/<name>.prof')
+    options.add_argument('--loop-engine', default='runs', choices=('runs', 'naive', 'hierarchy', 'bounded'),
+                         help='loop identification engine (hierarchy: all nesting levels in one pass, '
+                              'bounded: no suffix array, loop bodies of at most --max-period commands)')
+    options.add_argument('--max-period', type=int, default=128,
+                         help='longest loop body, in commands, the bounded engine (or --window) looks for')
+    options.add_argument('--window', type=int, default=0,
+                         help='find loops over overlapping windows of this many commands (0: whole program)')
+    options.add_argument('--frontend', default='pyrtl', choices=('pyrtl', 'stream'),
+                         help='BLIF import: pyrtl.input_from_blif, or the streaming blifFrontend')
+    options.add_argument('--cleanup', default='defs', choices=('defs', 'pyrtl'),
+                         help='netlist cleanup: one pass over the def map, or the PyRTL wire removal and '
+                              'combine_slice_concats (--frontend pyrtl only)')
+    options.add_argument('--intern', action='store_true',
+                         help='share structurally equal subexpressions of the AST (less memory on large netlists)')
+    options.add_argument('--budget', type=float, default=3600,
+                         help='time budget in seconds; partial results are written once it runs out')
+    options, argv = options.parse_known_args()
+    argv = [sys.argv[0]] + argv
+
+    if len(argv) - 1 < 2:
         print(help_text)
         exit(1)
 
-    format = sys.argv[1]
+    format = argv[1]
     if format not in ('-pyrtl', '-sv'):
         print(help_text)
         exit(1)
 
     clock = 'clk'
-    if len(sys.argv) - 1 == 3:
-        clock = sys.argv[3]
+    if len(argv) - 1 == 3:
+        clock = argv[3]
+
+    cache = None
+    if options.cache_dir:
+        cache = NetlistCache(options.cache_dir, options.cache_size * 1024 * 1024)
 
-    blif_filename = sys.argv[2]
+    blif_filename = argv[2]
     print('\nRunning benchmark:', blif_filename)
-    netlist = run_benchmark(blif_filename, clock, format)
+    trace = Trace()
+    netlist = run_benchmark(blif_filename, clock, format, trace, cache, options.profile,
+                            Deadline(options.budget), options.loop_engine, options.frontend,
+                            options.intern, options.max_period, options.window, options.cleanup)
+    if options.trace:
+        with open('results/' + result_name(blif_filename, 'trace.json'), 'w') as f:
+            trace.to_json(f)
     exit(0)
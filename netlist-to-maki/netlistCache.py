@@ -0,0 +1,108 @@
+import hashlib
+import importlib.metadata
+import os
+import pickle
+import tempfile
+import zlib
+
+# On-disk cache of converted netlists (the De Bruijn indexed Maki AST from main.block_to_ast()).
+# Entries are keyed on the BLIF contents, the clock name, the BLIF front end, whether the AST
+# is interned and CONVERTER_VERSION (which covers the front ends, netlistCleanup and netlistToMaki), and stored as zlib compressed pickles named <key>.maki. A hit refreshes
+# the entry's mtime; once the directory grows past max_bytes the least recently used entries are removed.
+
+CACHE_SUFFIX = '.maki'
+
+# Sources of the conversion: the BLIF front end, the def map cleanup and the translation to Maki.
+CONVERTER_SOURCES = ('netlistToMaki.py', 'main.py', 'blifFrontend.py', 'netlistCleanup.py')
+
+# Installed version of the PyRTL distribution ('' when it is not installed as one,
+# e.g. run from a source checkout). pyrtl itself has no __version__.
+def pyrtl_version():
+    try:
+        return importlib.metadata.version('pyrtl')
+    except importlib.metadata.PackageNotFoundError:
+        return ''
+
+# Changes whenever the conversion could: the converter sources (in directory, by default
+# the one holding this module) and the PyRTL version.
+def converter_version(directory=None):
+    here = directory or os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256(pyrtl_version().encode())
+    for source in CONVERTER_SOURCES:
+        with open(os.path.join(here, source), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+CONVERTER_VERSION = converter_version()
+
+class NetlistCache:
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, blif, clock, frontend='pyrtl', intern=False, cleanup='defs'):
+        h = hashlib.sha256()
+        h.update(blif.encode() if isinstance(blif, str) else blif)
+        h.update(b'\0' + clock.encode() + b'\0' + frontend.encode() + b'\0' + CONVERTER_VERSION.encode())
+        if intern:
+            h.update(b'\0intern')
+        if cleanup != 'defs':
+            h.update(b'\0cleanup ' + cleanup.encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    # Returns the cached AST for key, or None.
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                ast = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (zlib.error, pickle.UnpicklingError, EOFError, AttributeError):
+            # truncated or written by an incompatible converter
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by a concurrent run after it was read
+            pass
+        return ast
+
+    # Stores ast under key (written to a temporary file and renamed, so concurrent
+    # runs never see a partial entry), then evicts down to max_bytes.
+    def store(self, key, ast):
+        data = zlib.compress(pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
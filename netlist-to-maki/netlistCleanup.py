@@ -0,0 +1,198 @@
+import re
+import pyrtl
+from blifFrontend import BlifWire, eval_net
+
+# Cleanup of a netlist def map ({wire: net}, from main.block_defs() or blifFrontend) before
+# netlist_to_ast(), replacing the removal of unconnected wires and combine_slice_concats()
+# on the PyRTL block with one pass over the def-use graph:
+#   - one forward sweep in topological order rewrites every net's arguments through the
+#     replacements made so far and simplifies the net:
+#       constant propagation: a net of constants becomes a Const, a mux with a constant
+#       select becomes the selected argument, and a plain wire ('w') its argument;
+#       slice/concat combining: a select of a select or of a concat selects from the
+#       underlying wire, a select of a whole wire is that wire, and a concat inlines nested
+#       concats and merges adjacent selects of one wire and adjacent constants;
+#   - one backward sweep from the outputs and memory writes drops every net nothing live reads.
+# Inputs are always kept. Returns the new def map and counts of what was removed or rewritten
+# (removed_nets, folded_constants, propagated_copies, combined_slices, combined_concats).
+
+FOLDABLE = set('w~&|^n+-*=<>xcs')
+
+def tmp_index(w):
+    m = re.match(r'tmp([0-9]+)$', w.name)
+    return int(m.group(1)) if m else -1
+
+def cleanup_defs(defs):
+    counts = dict.fromkeys(('removed_nets', 'folded_constants', 'propagated_copies',
+                            'combined_slices', 'combined_concats'), 0)
+    wires = [w for w in defs if not isinstance(w, int)]
+    counter = [max([tmp_index(w) for w in wires] + [-1]) + 1]
+    consts = {}
+    for w in wires:
+        if w._code == 'C':
+            consts.setdefault((w.val, w.bitwidth), w)
+    added = []
+
+    def new_wire(bitwidth):
+        w = BlifWire('tmp' + str(counter[0]), bitwidth)
+        counter[0] += 1
+        added.append(w)
+        return w
+
+    def const(val, bitwidth):
+        if (val, bitwidth) not in consts:
+            c = BlifWire('const_{}_{}'.format(len(consts), val), bitwidth, 'C', val)
+            consts[(val, bitwidth)] = c
+            added.append(c)
+            out[c] = c
+        return consts[(val, bitwidth)]
+
+    # comb nets in topological order (registers and memory writes only read their results)
+    comb = [w for w, n in defs.items() if not isinstance(w, int) and n is not w and n is not None and n.op != 'r']
+    combSet = set(comb)
+    users = {}
+    pending = {}
+    for w in comb:
+        pending[w] = 0
+        for a in set(defs[w].args):
+            if a in combSet:
+                users.setdefault(a, []).append(w)
+                pending[w] += 1
+    order = [w for w in comb if not pending[w]]
+    for w in order:
+        for u in users.get(w, ()):
+            pending[u] -= 1
+            if not pending[u]:
+                order.append(u)
+    if len(order) < len(comb):
+        ordered = set(order)
+        order += [w for w in comb if w not in ordered]
+
+    out = {}
+    subst = {}
+
+    def replace(w, v):
+        subst[w] = v
+
+    def select_source(a):
+        n = out.get(a)
+        if n is not None and n is not a and n.op == 's':
+            return n.args[0], n.op_param
+        return None
+
+    def simplify(w, n):
+        args = tuple(subst.get(a, a) for a in n.args)
+        op, param = n.op, n.op_param
+        if w._code == 'O':
+            return pyrtl.LogicNet(op, param, args, n.dests)
+        if op in FOLDABLE and all(a._code == 'C' for a in args):
+            mask = (1 << w.bitwidth) - 1
+            replace(w, const(eval_net(n, [a.val for a in args], args) & mask, w.bitwidth))
+            counts['folded_constants'] += 1
+            return None
+        if op == 'w':
+            replace(w, args[0])
+            counts['propagated_copies'] += 1
+            return None
+        if op == 'x' and args[0]._code == 'C':
+            replace(w, args[2] if args[0].val else args[1])
+            counts['folded_constants'] += 1
+            return None
+        if op == 's':
+            src, param = args[0], tuple(param)
+            inner = select_source(src)
+            if inner is not None:
+                src, param = inner[0], tuple(inner[1][i] for i in param)
+                counts['combined_slices'] += 1
+            cn = out.get(src)
+            if cn is not None and cn is not src and cn.op == 'c':
+                bits = []
+                for piece in reversed(cn.args):
+                    bits += [(piece, j) for j in range(piece.bitwidth)]
+                picked = [bits[i] for i in param]
+                if all(p is picked[0][0] for p, _ in picked):
+                    src, param = picked[0][0], tuple(j for _, j in picked)
+                    counts['combined_slices'] += 1
+            if src._code == 'C':
+                replace(w, const(sum(((src.val >> i) & 1) << k for k, i in enumerate(param)), w.bitwidth))
+                counts['folded_constants'] += 1
+                return None
+            if param == tuple(range(src.bitwidth)):
+                replace(w, src)
+                counts['combined_slices'] += 1
+                return None
+            return pyrtl.LogicNet('s', param, (src,), (w,))
+        if op == 'c':
+            flat = []
+            for a in args:
+                an = out.get(a)
+                if an is not None and an is not a and an.op == 'c':
+                    flat += an.args
+                    counts['combined_concats'] += 1
+                else:
+                    flat.append(a)
+            # merge neighbours, most significant first
+            merged = []
+            for a in flat:
+                if merged:
+                    hi = merged[-1]
+                    if hi[0] is not None and hi[0]._code == 'C' and a._code == 'C':
+                        merged[-1] = (const((hi[0].val << a.bitwidth) | a.val, hi[0].bitwidth + a.bitwidth), None)
+                        counts['combined_concats'] += 1
+                        continue
+                    lo = select_source(a)
+                    if hi[1] is not None and lo is not None and lo[0] is hi[1][0] \
+                            and hi[1][1][0] == lo[1][-1] + 1:
+                        merged[-1] = (None, (lo[0], tuple(lo[1]) + tuple(hi[1][1])))
+                        counts['combined_concats'] += 1
+                        continue
+                merged.append((a, select_source(a)))
+            pieces = []
+            for a, sel in merged:
+                if a is None:
+                    src, param = sel
+                    if len(merged) == 1 and param == tuple(range(src.bitwidth)):
+                        replace(w, src)
+                        counts['combined_concats'] += 1
+                        return None
+                    if len(merged) == 1:
+                        return pyrtl.LogicNet('s', param, (src,), (w,))
+                    a = new_wire(len(param))
+                    out[a] = pyrtl.LogicNet('s', param, (src,), (a,))
+                pieces.append(a)
+            if len(pieces) == 1:
+                replace(w, pieces[0])
+                counts['combined_concats'] += 1
+                return None
+            return pyrtl.LogicNet('c', None, tuple(pieces), (w,))
+        return pyrtl.LogicNet(op, param, args, n.dests)
+
+    for w in order:
+        n = simplify(w, defs[w])
+        if n is not None:
+            out[w] = n
+    for w, n in defs.items():
+        if w in out or w in subst:
+            continue
+        if n is w or n is None:
+            out[w] = n
+        else:
+            out[w] = pyrtl.LogicNet(n.op, n.op_param, tuple(subst.get(a, a) for a in n.args), n.dests)
+
+    # backward sweep from the outputs and memory writes
+    live = set()
+    stack = [w for w in out if isinstance(w, int) or w._code == 'O']
+    while stack:
+        w = stack.pop()
+        if w in live:
+            continue
+        live.add(w)
+        n = out.get(w)
+        if n is not None and n is not w:
+            stack += [a for a in n.args if a not in live]
+    result = {}
+    for w in list(defs) + added:
+        if w in out and (w in live or (not isinstance(w, int) and w._code == 'I')):
+            result[w] = out[w]
+    counts['removed_nets'] = sum(1 for w, n in defs.items() if n is not w and n is not None and w not in result)
+    return result, counts
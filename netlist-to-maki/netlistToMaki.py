@@ -4,79 +4,97 @@ import copy
 import math
 import pyrtl
 import sys
-from suffixarray import suffix_array, lcp_array, tandem_repeats
-import signal
+from suffixarray import suffix_and_lcp_arrays, tandem_repeats, tandem_repeats_runs, \
+        runs, splice_runs_changes, tandem_repeats_from_runs, tandem_repeats_bounded, runs_windowed, runs_bounded, \
+        tandem_repeats_windowed
+import bisect
 import copy
+import heapq
+from array import array
 
-class TimeoutException(Exception):
-    pass
-
-# AST for abstractly representing Maki IR
+# AST for abstractly representing Maki IR.
+# Nodes are slotted (no per-instance __dict__): each subclass only stores its _fields.
 class AST:
+    __slots__ = ()
     _fields = ()
     def __init__(self, *args): #, line=None):
-        self.HOLES = 0
-        self.HOLE = 'h_'
         for n,x in zip(self._fields, args):
             setattr(self, n, x)
 
+    # Copy of the node with some fields replaced; the other fields are shared, not copied.
+    def replace(self, **changes):
+        return type(self)(*[changes.get(n, getattr(self, n)) for n in self._fields])
+
+# Subclasses of AST for defining each component in the IR
+class Block(AST):
+    _fields = ('cmds',)
+    __slots__ = _fields + ('HOLES',)
+    HOLE = 'h_'
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.HOLES = 0
+
     def newHole(self):
         name = self.HOLE + str(self.HOLES)
         self.HOLES += 1
         return name
 
-# Subclasses of AST for defining each component in the IR
-class Block(AST):
-    _fields = ('cmds',)
     def __str__(self):
         return '\n'.join(str(c) for c in self.cmds)
 
 class DefCmd(AST):
     _fields = ('lhs', 'rhs')
+    __slots__ = _fields
     def __str__(self):
         return '({0} {1})'.format(str(self.lhs), str(self.rhs))
 
 class AssignCmd(AST):
     _fields = ('lhs', 'rhs')
+    __slots__ = _fields
     def __str__(self):
         return '({0} (<<= {1}))'.format(str(self.lhs), str(self.rhs))
 
 class ForCmd(AST):
     _fields = ('index', 'range', 'body')
+    __slots__ = _fields
     def __str__(self):
         return '({0} (for-range {0} {1} (loop-body\n{2})))'.format(str(self.index), str(self.range), str(self.body))
 
+# Maki names of the WireExp operators.
+WIREEXP_OPS = {
+    '+': 'w+',
+    '-': 'w-',
+    '*': 'w*',
+    '&': 'w&',
+    '|': 'w||',
+    '^': 'w^',
+    '=': 'w=',
+    '<': 'w<',
+    '>': 'w>',
+    'n': 'wn',
+    '~': 'w~',
+    'x': 'wx',
+    'c': 'wc',
+    'Input': 'Input',
+    'Output': 'Output',
+    'Register': 'Register',
+    'Const': 'bv-const',
+    'MemBlock': 'mem-block-create',
+    'RomBlock': 'rom-block-create',
+    's': 'ws',
+    'r': '',
+    'w': '<w=',
+    'm': 'wm',
+    '@': 'w@',
+    'array-store': 'array-store',
+    'array-ref': 'array-ref'
+}
+
 class WireExp(AST):
     _fields = ('op', 'args')
+    __slots__ = _fields
     def __str__(self):
-        op = {
-                '+': 'w+',
-                '-': 'w-',
-                '*': 'w*',
-                '&': 'w&',
-                '|': 'w||',
-                '^': 'w^',
-                '=': 'w=',
-                '<': 'w<',
-                '>': 'w>',
-                'n': 'wn',
-                '~': 'w~',
-                'x': 'wx',
-                'c': 'wc',
-                'Input': 'Input',
-                'Output': 'Output',
-                'Register': 'Register',
-                'Const': 'bv-const',
-                'MemBlock': 'mem-block-create',
-                'RomBlock': 'rom-block-create',
-                's': 'ws',
-                'r': '',
-                'w': '<w=',
-                'm': 'wm',
-                '@': 'w@',
-                'array-store': 'array-store',
-                'array-ref': 'array-ref'
-            }[self.op]
+        op = WIREEXP_OPS[self.op]
 
         if self.op in '+-*&|^=<>n':
             arg0 = str(self.args[0])
@@ -121,16 +139,19 @@ class WireExp(AST):
 
 class Wire(AST):
     _fields = ('name', 'bitwidth', 'type')
+    __slots__ = _fields
     def __str__(self):
         return '{0}'.format(str(self.name))
 
 class WireSlice(AST):
     _fields = ('vexps',)
+    __slots__ = _fields
     def __str__(self):
         return '{0}'.format(' '.join(str(x) for x in self.vexps))
 
 class ValExp(AST):
     _fields = ('op', 'args')
+    __slots__ = _fields
     def __str__(self):
         args = ' '.join('(list {})'.format(' '.join(str(y) for y in x)) \
                 if isinstance(x, list) \
@@ -139,42 +160,200 @@ class ValExp(AST):
 
 class Var(AST):
     _fields = ('name', 'slice')
+    __slots__ = _fields
     def __str__(self):
         return '{0}'.format(str(self.name))
 
 class VarIndex(AST):
     _fields = ('value',)
+    __slots__ = _fields
     def __str__(self):
         return '[{0}]'.format(str(self.value)) if self.value else ''
 
 class VarSlice(AST):
     _fields = ('lhs', 'rhs')
+    __slots__ = _fields
     def __str__(self):
         return '[{0}:{1}]'.format(str(self.lhs), str(self.rhs)) if self.lhs or self.rhs else ''
 
 class Literal(AST):
     _fields = ('value',)
+    __slots__ = _fields
     def __str__(self):
         return str(self.value)
 
+# De Bruijn index of a wire/var use: offset (a negative int) to the defining command.
+# addr marks an address-of use, which is rendered as '(& offset)'.
+class DbIndex(AST):
+    _fields = ('offset', 'addr')
+    __slots__ = _fields
+    def render(self, value):
+        return '(& {})'.format(value) if self.addr else '{}'.format(value)
+
+    def __str__(self):
+        return self.render(self.offset)
+
 class ArrayCreate(AST):
     _fields = ('size',)
+    __slots__ = _fields
     def __str__(self):
         return '(array-create ' + str(self.size) + ')'
 
+# Hash-consing of AST subexpressions: intern(x) returns the one node structurally equal to x
+# that was interned before (or x itself the first time), so equal subexpressions share one
+# object and compare with `is`. Nodes are keyed by their type and fields, with child nodes
+# keyed by identity, so children must be interned first (bottom-up).
+# Interned nodes are shared by every command that uses them and must not be modified in place.
+class Interner:
+    def __init__(self):
+        self.nodes = {}
+        self.lookups = 0
+
+    def key(self, v):
+        if isinstance(v, AST):
+            return id(v)
+        if isinstance(v, list):
+            return (list,) + tuple(self.key(x) for x in v)
+        return (type(v), v)
+
+    def intern(self, x):
+        self.lookups += 1
+        return self.nodes.setdefault((type(x),) + tuple(self.key(getattr(x, n)) for n in x._fields), x)
+
+    def __len__(self):
+        return len(self.nodes)
+
+# The pieces str(x) is made of: strings are written as they are, anything else is expanded
+# in turn (AST nodes) or written with str(). Returns None for values that are only str()'d.
+def maki_pieces(x):
+    if isinstance(x, Block):
+        pieces = []
+        for c in x.cmds:
+            pieces += (c, '\n')
+        return pieces[:-1]
+    if isinstance(x, DefCmd):
+        return ['(', x.lhs, ' ', x.rhs, ')']
+    if isinstance(x, AssignCmd):
+        return ['(', x.lhs, ' (<<= ', x.rhs, '))']
+    if isinstance(x, ForCmd):
+        return ['(', x.index, ' (for-range ', x.index, ' ', x.range, ' (loop-body\n', x.body, ')))']
+    if isinstance(x, WireExp):
+        op = WIREEXP_OPS[x.op]
+        args = x.args
+        if x.op in '+-*&|^=<>n':
+            return ['(', op, ' ', args[0], ' ', args[1], ')']
+        elif x.op in '~':
+            return ['(', op, ' ', args[0], ')']
+        elif x.op in 'c':
+            return ['(', op, ' (list '] + spaced(args) + ['))']
+        elif x.op in 's':
+            if isinstance(args[1], WireSlice):
+                return ['(', op, ' ', args[0], ' (list ', args[1], '))']
+            return ['(', op, ' ', args[0], ' ', args[1], ')']
+        elif x.op in 'x':
+            return ['(', op, ' ', args[0], ' ', args[1], ' ', args[2], ')']
+        elif x.op == 'Const':
+            return ['(', op, ' ', args[0], ' ', args[1], ')']
+        elif x.op in 'r':
+            return [args[0]]
+        elif x.op in 'w':
+            return ['(', op, ' ', args[0], ')']
+        elif x.op in ['Register', 'Input', 'Output']:
+            return ['(', op, ' ', args[1], ')']
+        else:
+            return ['(', op, ' '] + spaced(args) + [')']
+    if isinstance(x, (Wire, Var)):
+        return [x.name]
+    if isinstance(x, Literal):
+        return [x.value]
+    if isinstance(x, WireSlice):
+        return spaced(x.vexps)
+    if isinstance(x, ValExp):
+        pieces = ['(', x.op, ' ']
+        for i, a in enumerate(x.args):
+            if i:
+                pieces.append(' ')
+            if isinstance(a, list):
+                pieces += ['(list '] + spaced(a) + [')']
+            else:
+                pieces.append(a)
+        return pieces + [')']
+    if isinstance(x, ArrayCreate):
+        return ['(array-create ', x.size, ')']
+    return None
+
+def spaced(xs):
+    pieces = []
+    for x in xs:
+        pieces += (x, ' ')
+    return pieces[:-1]
+
+# Write str(ast) to the file f without building it in memory or recursing:
+# the s-expression pieces are expanded from an explicit stack and written in chunks.
+def write_maki(ast, f, chunk=1 << 16):
+    out = []
+    size = 0
+    stack = [ast]
+    while stack:
+        x = stack.pop()
+        if type(x) is not str:
+            pieces = maki_pieces(x)
+            if pieces is not None:
+                stack.extend(reversed(pieces))
+                continue
+            x = str(x)
+        out.append(x)
+        size += len(x)
+        if size >= chunk:
+            f.write(''.join(out))
+            out = []
+            size = 0
+    f.write(''.join(out))
+
+# Token names of the WireExp operators.
+TOKEN_OPS = {
+    '+': '+',
+    '-': '-',
+    '*': '*',
+    '&': '&',
+    '|': '|',
+    '^': '^',
+    '=': '=',
+    '<': '<',
+    '>': '>',
+    'n': 'n',
+    '~': '~',
+    'x': 'x',
+    'c': 'c',
+    'Input': 'I',
+    'Output': 'O',
+    'Register': 'R',
+    'Const': 'C',
+    's': 's',
+    'r': 'r',
+    'w': 'w',
+    'm': 'm',
+    '@': '@',
+}
+
 # Tokenize a Maki IR AST.
 # Recurisvely walks the AST;
 # primarily considers WireVector expression operators.
-def ast_to_tokens(ast):
+# With a memo (for an interned AST, see Interner), the tokens of expressions are kept by
+# node identity, so an expression shared between commands is tokenized once.
+def ast_to_tokens(ast, memo=None):
+    if memo is not None and isinstance(ast, (WireExp, WireSlice)):
+        # entries hold the node, so that its id is not reused
+        hit = memo.get(id(ast))
+        if hit is None:
+            hit = memo[id(ast)] = (ast, expression_tokens(ast, memo))
+        return hit[1]
     if isinstance(ast, Block):
-        cmds = ()
-        for c in ast.cmds:
-            cmds += (ast_to_tokens(c),)
-        return cmds
+        return tuple(ast_to_tokens(c, memo) for c in ast.cmds)
     elif isinstance(ast, DefCmd):
         # lhs rhs
         lhs = ast_to_tokens(ast.lhs)
-        rhs = ast_to_tokens(ast.rhs)
+        rhs = ast_to_tokens(ast.rhs, memo)
         return (lhs, rhs)
     elif isinstance(ast, AssignCmd):
         # lhs rhs
@@ -182,48 +361,16 @@ def ast_to_tokens(ast):
             lhs = str(ast.lhs.bitwidth) + ast.lhs.type
         else:
             lhs = ast_to_tokens(ast.lhs)
-        rhs = ast_to_tokens(ast.rhs)
+        rhs = ast_to_tokens(ast.rhs, memo)
         return (lhs, rhs)
     elif isinstance(ast, ForCmd):
-        body = ast_to_tokens(ast.body)
+        body = ast_to_tokens(ast.body, memo)
         return ('LOOPSTART',) + body + ('LOOPEND',)
-    elif isinstance(ast, WireExp):
-        # op args
-        argtokens = [ast_to_tokens(a) for a in ast.args]
-        argtokens = '-'.join(a for a in argtokens if a != '')
-        op = {
-                '+': '+',
-                '-': '-',
-                '*': '*',
-                '&': '&',
-                '|': '|',
-                '^': '^',
-                '=': '=',
-                '<': '<',
-                '>': '>',
-                'n': 'n',
-                '~': '~',
-                'x': 'x',
-                'c': 'c',
-                'Input': 'I',
-                'Output': 'O',
-                'Register': 'R',
-                'Const': 'C',
-                's': 's',
-                'r': 'r',
-                'w': 'w',
-                'm': 'm',
-                '@': '@',
-        }[ast.op]
-        return '{}'.format(op) + (argtokens if ast.op in 'csx' else \
-                argtokens.translate({ord(i): None for i in argtokens if i in 'C'}))
+    elif isinstance(ast, (WireExp, WireSlice)):
+        return expression_tokens(ast, memo)
     elif isinstance(ast, Wire):
         # ignore
         return ''
-    elif isinstance(ast, WireSlice):
-        # vexps
-        vexps = ','.join(ast_to_tokens(v) for v in ast.vexps)
-        return '({})'.format(vexps)
     elif isinstance(ast, ValExp):
         return ''
     elif isinstance(ast, Var):
@@ -241,6 +388,82 @@ def ast_to_tokens(ast):
     else:
         return ''
 
+# Tokens of a WireExp or WireSlice (see ast_to_tokens()).
+def expression_tokens(ast, memo):
+    if isinstance(ast, WireExp):
+        # op args
+        argtokens = [ast_to_tokens(a, memo) for a in ast.args]
+        argtokens = '-'.join(a for a in argtokens if a != '')
+        return TOKEN_OPS[ast.op] + (argtokens if ast.op in 'csx' else argtokens.replace('C', ''))
+    # WireSlice: vexps
+    vexps = ','.join(ast_to_tokens(v, memo) for v in ast.vexps)
+    return '({})'.format(vexps)
+
+# Symbol table for interned command tokens:
+# every distinct command token (as built by ast_to_tokens) gets a dense integer id.
+class TokenTable:
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def intern(self, token):
+        tid = self.ids.get(token)
+        if tid is None:
+            tid = len(self.tokens)
+            self.ids[token] = tid
+            self.tokens.append(token)
+        return tid
+
+    def decode(self, tid):
+        return self.tokens[tid]
+
+# Memo of the token id of every command node tokenized so far, over a TokenTable
+# (which hash-conses the tokens themselves: equal tokens share one id).
+# Entries are keyed on node identity, and hold the node so that its id is not reused.
+# Loop collapsing and rerolling build new nodes instead of rewriting old ones, so across
+# loop_id rounds only the new ForCmds are tokenized (from the memoized ids of their bodies);
+# a command rewritten in place must be dropped with invalidate().
+# With interned, the AST is hash-consed (see Interner) and its expressions are tokenized once
+# per node, by identity (see ast_to_tokens()); interned nodes are rebuilt, never rewritten in place.
+class TokenCache:
+    def __init__(self, table=None, interned=False):
+        self.table = TokenTable() if table is None else table
+        self.ids = {}
+        self.memo = {} if interned else None
+
+    def token_id(self, c):
+        hit = self.ids.get(id(c))
+        if hit is not None and hit[0] is c:
+            return hit[1]
+        if isinstance(c, ForCmd):
+            token = ('LOOPSTART',) + tuple(self.table.decode(self.token_id(b)) for b in c.body.cmds) + ('LOOPEND',)
+        else:
+            token = ast_to_tokens(c, self.memo)
+        tid = self.table.intern(token)
+        self.ids[id(c)] = (c, tid)
+        return tid
+
+    def invalidate(self, c):
+        self.ids.pop(id(c), None)
+
+# Tokenize a Maki IR Block into a compact integer stream:
+# one interned id per command, stored in an array('i')
+# (wrap with numpy.frombuffer(ids, dtype=numpy.intc) for a zero-copy NumPy view).
+# Returns the id stream and the TokenTable used to decode it.
+# With a TokenCache, commands it has seen before are not tokenized again.
+# With interned (a hash-consed AST, see Interner), expressions shared between commands are tokenized once.
+def ast_to_token_ids(ast, table=None, cache=None, interned=False):
+    if cache is not None:
+        return array('i', (cache.token_id(c) for c in ast.cmds)), cache.table
+    if table is None:
+        table = TokenTable()
+    memo = {} if interned else None
+    ids = array('i', (table.intern(ast_to_tokens(c, memo)) for c in ast.cmds))
+    return ids, table
+
 # Translate Maki IR AST to concrete syntax ingestible by Racket tool
 def ir_to_racket(ast, netlist_name):
     var = dict() # var name -> uint
@@ -266,8 +489,8 @@ def ir_to_racket(ast, netlist_name):
                     vid += 1
                 c.lhs.name = var[str(c.lhs.name)]
             elif isinstance(c, ForCmd):
+                # a loop index is not a wire (ForCmd has no lhs), so it has no signal width
                 var[str(c.index)] = vid
-                internal_signals[vid] = c.lhs.bitwidth
                 vid += 1
                 c.index = var[str(c.index)]
                 vid = mapVarToNum(c.body, vid)
@@ -284,20 +507,50 @@ def tokens_to_string(tokens):
 
 # From a tokenized Maki AST, returns a maximal tandem repeat.
 # Relies on suffixarray library.
-def get_tandem_repeats_from_tokens(s):
-    sa = suffix_array(s)
-    lcp = lcp_array(s, sa)
-
-    tandems = tandem_repeats(s, sa, lcp)
+# engine picks how tandem repeats are found: 'runs' (near-linear, via maximal runs),
+# 'naive' (scan over the suffix and lcp arrays) or 'bounded' (runs of at most max_period
+# tokens, found without a suffix array in O(n) memory; the same result as 'runs' when
+# no loop body is longer);
+# sa_engine picks the suffix array builder used by 'runs' and 'naive'
+# ('sais', 'numpy' for NumPy prefix doubling, or 'naive').
+# With a window, 'runs' works over windows of that many tokens (see window_runs()).
+# When s is an interned id stream, table is the TokenTable that decodes it.
+def get_tandem_repeats_from_tokens(s, engine='runs', sa_engine='sais', table=None, max_period=128, window=None):
+    if engine == 'runs' and window:
+        return select_run_repeat(s, tandem_repeats_windowed(s, window, max_period, sa_engine), table)
+    elif engine == 'runs':
+        return select_run_repeat(s, tandem_repeats_runs(s, sa_engine), table)
+    elif engine == 'bounded':
+        return select_run_repeat(s, tandem_repeats_bounded(s, max_period), table)
+    elif engine == 'naive':
+        s = tuple(s)
+        sa, lcp = suffix_and_lcp_arrays(s, sa_engine)
+        return select_tandem_repeat(tandem_repeats(s, sa, lcp), table)
+    else:
+        raise ValueError('unknown tandem repeat engine: {}'.format(engine))
+
+# Picks the loop candidate from the (start, body length, iterations) tandem repeats of the runs
+# of tokens (see suffixarray.tandem_repeats_from_runs()): the most iterations (at least three),
+# then the latest start, then the longest body, skipping repeats made only of port/const/wire
+# declarations. Repeats are tried best first, so only the bodies that are checked are decoded.
+def select_run_repeat(tokens, repeats, table=None):
+    order = [(-r, -s, -l) for s, l, r in repeats if r >= 3]
+    heapq.heapify(order)
+    while order:
+        r, s, l = [-x for x in heapq.heappop(order)]
+        body = tokens[s:s + l]
+        if is_loop_body([table.decode(t) for t in body] if table else body):
+            return (s, l, r)
+    return (None, None, None)
+
+# Picks the loop candidate from a dictionary of tandem repeats
+# (as built by the suffixarray library), skipping repeats with fewer than
+# three iterations and repeats made only of port/const/wire declarations.
+def select_tandem_repeat(tandems, table=None):
     max_repeater = ''
     for k,v in tandems.items():
-        str_ops = ''.join([str(w[1]) for w in k])
-        str_ops = str_ops.translate({ord(i): None for i in str_ops if i in ' ,'})
-        str_IOR = str_ops.translate({ord(i): None for i in str_ops if i not in 'IORCwr'})
-
-        if str_IOR and str_ops == len(str_IOR) * str_IOR[0]:
-            continue
-        if not str_ops:
+        cmds = [table.decode(w) for w in k] if table else k
+        if not is_loop_body(cmds):
             continue
         elif v[1] < 3:
             continue
@@ -319,20 +572,118 @@ def get_tandem_repeats_from_tokens(s):
     return (tandems[max_repeater][0], len(max_repeater), tandems[max_repeater][1])
     # Returns (start-of-loop, length-of-rerolled-loop-body, number-of-repeats)
 
+# Whether the command tokens of a repeat make a loop body:
+# repeats made only of port/const/wire declarations do not.
+def is_loop_body(cmds):
+    str_ops = ''.join([str(w[1]) for w in cmds])
+    str_ops = str_ops.translate({ord(i): None for i in str_ops if i in ' ,'})
+    str_IOR = str_ops.translate({ord(i): None for i in str_ops if i not in 'IORCwr'})
+    if str_IOR and str_ops == len(str_IOR) * str_IOR[0]:
+        return False
+    return bool(str_ops)
+
 # Identifies a loop candidate from a tokenized Maki program.
 # Note: This returns the maximal loop candidate;
 # this function is intended to be called repeatedly
 # until all viable/interesting loop candidates are found.
 # (See `blif-benchmark.py` find_loops() for an example.)
-def loop_id(ast):
+# A TokenCache shared across calls keeps the tokens of unchanged commands.
+def loop_id(ast, engine='runs', sa_engine='sais', cache=None, max_period=128, window=None):
 
-    tok = ast_to_tokens(ast)
+    tok, table = ast_to_token_ids(ast, cache=cache)
 
-    s,l,r = get_tandem_repeats_from_tokens(tok)
+    s,l,r = get_tandem_repeats_from_tokens(tok, engine, sa_engine, table, max_period, window)
     # Returns (start-of-loop, length-of-rerolled-loop-body, number-of-repeats)
     if not s:
         return (None, ast)
 
+    return collapse_loop(ast, s, l, r)
+
+# Runs of a token stream: with a window, computed over overlapping windows of that many tokens
+# and stitched across the window borders (suffixarray.runs_windowed()), so the suffix structures
+# stay bounded by the window instead of growing with the program (tok and the runs still cover
+# the whole program); only runs of at most max_period tokens are found then.
+# Without a window, all runs of the whole stream.
+def window_runs(tok, sa_engine='sais', window=None, max_period=128):
+    if window:
+        return runs_windowed(tok, window, max_period, sa_engine)
+    return runs(tok, sa_engine)
+
+# Token stream and runs of a Maki program, kept alive across loop identification rounds.
+# Collapsing a loop splices the stream in place (the new ForCmd token is built from
+# the tokens of its first iteration, so nothing is re-tokenized) and only the runs
+# touching the spliced region are recomputed.
+# The candidates of the runs (see select_run_repeat()) are kept in a heap, best first.
+# Positions move as loops collapse, so heap entries name tokens by label instead: every token
+# keeps the label it had in the first stream (a ForCmd token the label of its first token),
+# labels grow with the position, and a label is found again by bisecting the labels.
+# Entries of runs that are gone are dropped lazily, when they reach the top of the heap.
+# With the 'bounded' engine, the index holds the runs of at most max_period tokens (see
+# suffixarray.runs_bounded()), and no suffix array is built.
+class LoopIndex:
+    def __init__(self, ast, sa_engine='sais', window=None, max_period=128, interned=False, engine='runs'):
+        self.tokens, self.table = ast_to_token_ids(ast, interned=interned)
+        if engine == 'bounded':
+            self.runs = runs_bounded(self.tokens, max_period)
+        else:
+            self.runs = window_runs(self.tokens, sa_engine, window, max_period)
+        # with a window (or bounded), runs longer than max_period are never found, so splices must not add them
+        self.max_period = max_period if window or engine == 'bounded' else None
+        self.labels = array('i', range(len(self.tokens)))
+        self.heap = []
+        self.live = {} # run key -> its heap entry
+        for run in self.runs:
+            self.push(run)
+
+    def key(self, run):
+        a, b, p = run
+        return (self.labels[a], self.labels[b - 1], p)
+
+    def push(self, run):
+        (s, l, r), = tandem_repeats_from_runs([run])
+        if r >= 3:
+            entry = (-r, -self.labels[s], -l, self.key(run))
+            self.live[entry[3]] = entry
+            heapq.heappush(self.heap, entry)
+
+    def candidate(self):
+        while self.heap:
+            entry = self.heap[0]
+            if self.live.get(entry[3]) == entry:
+                r, s, l = -entry[0], bisect.bisect_left(self.labels, -entry[1]), -entry[2]
+                if is_loop_body([self.table.decode(t) for t in self.tokens[s:s + l]]):
+                    return (s, l, r)
+                # the tokens of a run do not change while it lives
+                del self.live[entry[3]]
+            heapq.heappop(self.heap)
+        return (None, None, None)
+
+    # replace the r iterations of the l-command loop at s with a single ForCmd token
+    def collapse(self, s, l, r):
+        end = s + l * r
+        body = tuple(self.table.decode(t) for t in self.tokens[s:s + l])
+        self.tokens[s:end] = array('i', [self.table.intern(('LOOPSTART',) + body + ('LOOPEND',))])
+        self.runs, removed, added = splice_runs_changes(self.tokens, self.runs, s, end, self.max_period)
+        for run in removed:
+            self.live.pop(self.key(run), None)
+        self.labels[s:end] = self.labels[s:s + 1]
+        for run in added:
+            self.push(run)
+
+# Same as loop_id, but finds the candidate from a LoopIndex of ast
+# and updates the index for the collapsed loop instead of re-tokenizing.
+def loop_id_incremental(ast, index):
+    s,l,r = index.candidate()
+    if not s:
+        return (None, ast)
+
+    index.collapse(s, l, r)
+    return collapse_loop(ast, s, l, r)
+
+# Rewrites the r iterations of the l-command loop at s into one ForCmd over the first iteration.
+# Returns the loop candidate (name of its first definition, body length, iterations)
+# and the rewritten Block.
+def collapse_loop(ast, s, l, r):
     startCmd = s
     lengthCmd = l
     endCmd = startCmd + lengthCmd * r
@@ -343,43 +694,134 @@ def loop_id(ast):
 
     post = Block(ast.cmds[endCmd:])
 
-    ports = 0
-    for c in pre.cmds:
-        if isinstance(c, DefCmd):
-            if isinstance(c.rhs, WireExp):
-                if c.rhs.op == 'Input':
-                    ports += 1
-                elif c.rhs.op == 'Output':
-                    ports += 1
-                elif c.rhs.op == 'Register':
-                    ports += 1
-                else:
-                    continue
-
-    return ([(loop.cmds[0].body.cmds[0].lhs.name if isinstance(loop.cmds[0], ForCmd) else loop.cmds[0].lhs.name),l,r], Block(pre.cmds + [ForCmd(Literal(ast.newHole()), Literal(r), Block(loop.cmds))] + post.cmds))
-
-
-def find_loops(ir, varMap):
-
-    def timeout_handler(signum, frame):
-        raise TimeoutException()
+    # a loop is named by its first definition, which may sit inside nested loops
+    first = loop.cmds[0]
+    while isinstance(first, ForCmd):
+        first = first.body.cmds[0]
+
+    return ([first.lhs.name,l,r], Block(pre.cmds + [ForCmd(Literal(ast.newHole()), Literal(r), Block(loop.cmds))] + post.cmds))
+
+
+# Nesting tree of the loops in a token stream, built from its runs in one pass
+# instead of collapsing one loop per round.
+# Every run with at least three iterations gives one candidate (start, body length, iterations)
+# (see suffixarray.tandem_repeats_from_runs()). Candidates are then placed largest span first: one that starts inside an
+# already placed loop becomes its child if it lies within that loop's first iteration, and is
+# dropped if it lies in a later iteration (a copy of a child) or overlaps a loop boundary.
+# Returns the top-level nodes [start, length, iterations, children], sorted by start;
+# lengths and starts are in tokens of the given (flat) stream.
+def loop_hierarchy(tokens, table, stream_runs):
+    candidates = []
+    for s, p, r in tandem_repeats_from_runs(stream_runs):
+        if r >= 3 and is_loop_body([table.decode(t) for t in tokens[s:s + p]]):
+            candidates.append((s, p, r))
+    candidates.sort(key=lambda c: (-c[1] * c[2], -c[2], c[0]))
+
+    def place(level, s, p, r):
+        starts, nodes = level
+        end = s + p * r
+        i = bisect.bisect_right(starts, s) - 1
+        if i >= 0:
+            ns, nl, nr, children = nodes[i]
+            if s < ns + nl * nr:
+                if end <= ns + nl:
+                    place(children, s, p, r)
+                return
+        if i + 1 < len(starts) and starts[i + 1] < end:
+            return
+        starts.insert(i + 1, s)
+        nodes.insert(i + 1, [s, p, r, ([], [])])
+
+    roots = ([], [])
+    for s, p, r in candidates:
+        place(roots, s, p, r)
+
+    def finish(level):
+        return [[s, p, r, finish(children)] for s, p, r, children in level[1]]
+    return finish(roots)
+
+# Single pass alternative to find_loops(): the loop hierarchy of ir from one runs computation
+# (see loop_hierarchy()). Returns the top-level loops as nodes
+# [first definition (mapped with varMap), body length, iterations, nested loops], where body
+# lengths count the commands of ir (nested loops unrolled) and nested loops lie in the first
+# iteration of their parent. Stops before the runs computation if the deadline has expired.
+# window and max_period stream the runs computation (see window_runs()).
+# interned marks a hash-consed ir (see ast_to_token_ids()).
+def find_loop_hierarchy(ir, varMap, sa_engine='sais', trace=None, deadline=None, window=None, max_period=128,
+                        interned=False):
+    tok, table = ast_to_token_ids(ir, interned=interned)
+    if trace is not None:
+        trace.set_count('commands_in_loop_id', len(ir.cmds))
+        trace.set_count('tokens', len(tok))
+        trace.count('loop_id_iterations')
+    if deadline is not None and deadline.expired('find_loops'):
+        print("Loop identifier timeout!")
+        return []
+    roots = loop_hierarchy(tok, table, window_runs(tok, sa_engine, window, max_period))
+
+    def named(nodes):
+        return [[varMap[str(ir.cmds[s].lhs.name)], l, r, named(children)] for s, l, r, children in nodes]
+    hierarchy = named(roots)
+    if trace is not None:
+        trace.count('candidates', len(hierarchy_loops(hierarchy)))
+    return hierarchy
+
+# The loops of a hierarchy in the form find_loops() returns them: [first definition,
+# body length, iterations], with the body length counting each nested loop as one command.
+def hierarchy_loops(hierarchy):
+    loops = []
+    def walk(nodes):
+        for name, l, r, children in nodes:
+            loops.append([name, l - sum(cl * cr - 1 for _, cl, cr, _ in children), r])
+            walk(children)
+    walk(hierarchy)
+    loops.sort(key=lambda x: x[0] + (x[1] * x[2]))
+    return loops
 
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(3600)
+# Repeatedly identifies and collapses loop candidates in ir until none are left.
+# With the 'runs' and 'bounded' engines the token stream and runs are maintained incrementally
+# across rounds (see LoopIndex) unless incremental is False; otherwise every round
+# re-tokenizes through one TokenCache, so only the ForCmd it collapsed is tokenized anew.
+# sa_engine picks the suffix array builder, and max_period bounds the loop bodies the
+# 'bounded' engine looks for (see get_tandem_repeats_from_tokens).
+# With a window, the 'runs' and 'hierarchy' engines compute runs over overlapping windows of
+# that many commands (see window_runs()), with loop bodies bounded by max_period.
+# With a trace (instrument.Trace), records the token count, loop_id iterations and candidates.
+# With a deadline (budget.Deadline), stops once it expires and returns the loops found so far.
+# interned marks a hash-consed ir, whose shared expressions are tokenized once (see TokenCache).
+# The 'hierarchy' engine finds all loops in one pass instead (see find_loop_hierarchy()).
+def find_loops(ir, varMap, engine='runs', sa_engine='sais', incremental=True, trace=None, deadline=None,
+               max_period=128, window=None, interned=False):
+    if engine == 'hierarchy':
+        return hierarchy_loops(find_loop_hierarchy(ir, varMap, sa_engine, trace, deadline, window, max_period,
+                                                   interned))
+
+    index = LoopIndex(ir, sa_engine, window, max_period, interned, engine) \
+        if incremental and engine in ('runs', 'bounded') else None
+    cache = TokenCache(interned=interned) if not index else None
+    if trace is not None:
+        trace.set_count('commands_in_loop_id', len(ir.cmds))
+        # without an index, the first loop_id round reuses these tokens from the cache
+        trace.set_count('tokens', len(index.tokens if index else ast_to_token_ids(ir, cache=cache)[0]))
 
     loops = []
-    try:
-        while True:
-            newLoop, ir = loop_id(ir)
-            if not newLoop:
-                break
-            newLoop[0] = varMap[str(newLoop[0])]
-            loops += [newLoop]
-        loops.sort(key=lambda x: x[0] + (x[1] * x[2]))
-    except TimeoutException:
-        print("Loop identifier timeout!")
-        return loops
-    signal.alarm(0)
+    while True:
+        if deadline is not None and deadline.expired('find_loops'):
+            print("Loop identifier timeout!")
+            break
+        if trace is not None:
+            trace.count('loop_id_iterations')
+        if index:
+            newLoop, ir = loop_id_incremental(ir, index)
+        else:
+            newLoop, ir = loop_id(ir, engine, sa_engine, cache, max_period, window)
+        if not newLoop:
+            break
+        if trace is not None:
+            trace.count('candidates')
+        newLoop[0] = varMap[str(newLoop[0])]
+        loops += [newLoop]
+    loops.sort(key=lambda x: x[0] + (x[1] * x[2]))
     return loops
 
 # Dataflow analysis over Maki IR Block.
@@ -408,10 +850,58 @@ def usesInBlock(block):
                     uses[str(a)].append(str(c.lhs))
     return uses
 
+# Dataflow analysis over a list of Maki IR commands.
+# Returns dictionary of argument names to the (command, argument position) pairs
+# where they appear as a top-level argument of a WireExp definition.
+def argUsesInBlock(cmds):
+    uses = defaultdict(list)
+    for c in cmds:
+        if isinstance(c, (DefCmd, AssignCmd)) and isinstance(c.rhs, WireExp):
+            for ai, arg in enumerate(c.rhs.args):
+                uses[str(arg)].append((c, ai))
+    return uses
+
+# Topologically sort (wire, net) definition pairs over their def-use graph
+# (Kahn's algorithm). Among the definitions that are ready, the one that comes
+# first in the given order is emitted first, so an already valid order is kept as is.
+# Definitions on a cycle are appended in their given order, and so is everything
+# not yet emitted if the deadline (budget.Deadline) expires.
+def topoSortDefs(defpairs, deadline=None):
+    index = {w.name: i for i,(w,_) in enumerate(defpairs)}
+    users = [[] for _ in defpairs]
+    pending = [0] * len(defpairs)
+    for i,(w,n) in enumerate(defpairs):
+        for d in set(index.get(a.name) for a in n.args if a._code == 'W'):
+            if d is not None and d != i:
+                users[d].append(i)
+                pending[i] += 1
+
+    ready = [i for i in range(len(defpairs)) if not pending[i]]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        if deadline is not None and not len(order) % 256 and deadline.expired('topoSortDefs'):
+            break
+        i = heapq.heappop(ready)
+        order.append(i)
+        for u in users[i]:
+            pending[u] -= 1
+            if not pending[u]:
+                heapq.heappush(ready, u)
+    if len(order) < len(defpairs):
+        emitted = set(order)
+        order += [i for i in range(len(defpairs)) if i not in emitted]
+    return [defpairs[i] for i in order]
+
 # Translate PyRTL netlist to Maki IR AST.
 # Starts with top-level declarations (Inputs, Outputs, Registers, Memories),
 # then proceeds to WireVector assignments.
-def netlist_to_ast(defs, foldSelects=True):
+# If the deadline (budget.Deadline) expires, the temps are only partially ordered
+# and the remaining constant/select folding is skipped.
+# With an Interner, the argument subexpressions (wires, literals, inlined constants and
+# folded selects) are hash-consed, so every use of the same wire or constant shares one node.
+def netlist_to_ast(defs, foldSelects=True, deadline=None, interner=None):
+    share = interner.intern if interner is not None else (lambda x: x)
     # gather all tmps
     tmps = []
     # gather all regs
@@ -454,53 +944,13 @@ def netlist_to_ast(defs, foldSelects=True):
     regs.sort(key=lambda x: int(x[0].name[3:]) if x[0].name[:3] == 'tmp' else x[0].name)
 
     # move all mem reads to the front first
-    memreads = []
-    for i,defpair in enumerate(tmps):
-        w,n = defpair
-        if n.op == 'm':
-            memreads.append(i)
-    for i in memreads:
-        defpair = tmps.pop(i)
-        tmps.insert(0, defpair)
+    tmps = [d for d in tmps if d[1].op == 'm'] + [d for d in tmps if d[1].op != 'm']
 
     # Consider `tmp_i` and `tmp_j` with i < j. I assumed this implied that
     # `tmp_i` is defined _before_ `tmp_j`. This is sometimes true, but not always.
-    # One example is the `demultiplexer` benchmark. One solution is to first do
-    # the monotonic ordering. Then, do a basic def-use analysis of temp wire
-    # definitions---noting when a definition uses a wire that has not been defined
-    # yet. After noting this, repair by moving the missing definition later.
-    def findNotDefs():
-        defd = {}
-        fixes = {}
-        for i,defpair in enumerate(tmps):
-            w,n = defpair
-            defd[w.name] = n
-            for a in n.args:
-                if a._code == 'W' and a.name not in defd:
-                    fixes[a.name] = w.name
-        return fixes
-
-    worklist = findNotDefs()
-    def timeout_handler(signum, frame):
-        raise TimeoutException()
-
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(3600)
-    try:
-        while worklist:
-            for k,v in worklist.items():
-                for i,defpair in enumerate(tmps):
-                    w,_ = defpair
-                    if w._code == 'W' and w.name == k:
-                        for j,fixpair in enumerate(tmps):
-                            if fixpair[0].name == v:
-                                fixdef = tmps.pop(j)
-                                tmps.insert(i, fixdef)
-            worklist = findNotDefs()
-    except TimeoutException:
-        print("Definition rewrite timeout.")
-    signal.alarm(0)
-
+    # One example is the `demultiplexer` benchmark. So the order above is only
+    # used as a tie-break for a topological sort of the temp wire definitions.
+    tmps = topoSortDefs(tmps, deadline)
 
     cmds = []
     # init wires
@@ -540,6 +990,7 @@ def netlist_to_ast(defs, foldSelects=True):
                     Var(memids[i],[]),
                     ValExp('mem-block-create', [Literal(net.args[1].bitwidth), Literal(net.args[0].bitwidth)])))
 
+    portNames = set(x[0].name for x in outs + regs)
     for w,n in tmps + regs + outs + mems:
         if isinstance(w, int):
             lhs = Var(memids[n.op_param[0]],[])
@@ -558,14 +1009,14 @@ def netlist_to_ast(defs, foldSelects=True):
                 const_val = const[const.rfind('_') + 1:const.find('/')]
                 if "'b" in const_val:
                     const_val = const_val[:const_val.find("'b")]
-                name = Literal('const_' + const_val + '_' + str(a.bitwidth))
-                width = Literal(a.bitwidth)
+                name = share(Literal('const_' + const_val + '_' + str(a.bitwidth)))
+                width = share(Literal(a.bitwidth))
             else:
-                name = Literal(a.name)
-                width = Literal(a.bitwidth)
+                name = share(Literal(a.name))
+                width = share(Literal(a.bitwidth))
             if not name or not width:
                 continue
-            args.append(Wire(name, width, a._code))
+            args.append(share(Wire(name, width, a._code)))
 
         if op == 's':
             zeroExtendBits = 0
@@ -579,7 +1030,7 @@ def netlist_to_ast(defs, foldSelects=True):
                 cname = str(args[0].name)
                 val = cname[cname.find('_') + 1 : cname.rfind('_')]
                 op = 'Const'
-                args = [Literal(val), Literal(zeroExtendBits)]
+                args = [share(Literal(val)), share(Literal(zeroExtendBits))]
                 cmds.insert(const_index, DefCmd(lhs, WireExp(op, args)))
                 continue
             else:
@@ -593,11 +1044,11 @@ def netlist_to_ast(defs, foldSelects=True):
                     monotone = True
                     s = slices[i]
                 if monotone:
-                    low = Literal(str(slices[0]))
-                    high = Literal(str(slices[-1] + 1))
-                    args.append(ValExp('arange', [low, high]))
+                    low = share(Literal(str(slices[0])))
+                    high = share(Literal(str(slices[-1] + 1)))
+                    args.append(share(ValExp('arange', [low, high])))
                 else:
-                    args.append(WireSlice([a for a in n.op_param]))
+                    args.append(share(WireSlice([a for a in n.op_param])))
 
         if op == 'm' and n.op_param[0] not in memids and isinstance(n.op_param[1], pyrtl.MemBlock):
             i = n.op_param[0]
@@ -623,106 +1074,120 @@ def netlist_to_ast(defs, foldSelects=True):
 
         rhs = WireExp(op, args)
 
-        cmds.append(AssignCmd(lhs, args[0]) if (n.op in 'rw' and w.name in [x[0].name for x in outs+regs]) else DefCmd(lhs, rhs))
+        cmds.append(AssignCmd(lhs, args[0]) if (n.op in 'rw' and w.name in portNames) else DefCmd(lhs, rhs))
 
-    netdefs = defsInBlock(Block(cmds))
-    netuses = usesInBlock(Block(cmds))
+    # index every top-level WireExp argument once; each pass below only visits
+    # the uses of the definitions it rewrites. An indexed argument may already have
+    # been rewritten by an earlier fold, so its name is checked again before replacing it.
+    argUses = argUsesInBlock(cmds)
+
+    def usesOf(c, cmdTypes):
+        name = str(c.lhs)
+        for useCmd, ai in argUses.get(name, ()):
+            if isinstance(useCmd, cmdTypes) and str(useCmd.rhs.args[ai]) == name:
+                yield useCmd, ai
+
+    def outOfTime():
+        return deadline is not None and deadline.expired('netlist_to_ast')
 
     removeConsts = set()
     # replace const wires with Const expressions inlined
-    for i,c in enumerate(cmds):
+    for c in cmds:
+        if outOfTime():
+            break
         if isinstance(c, (DefCmd, AssignCmd)) \
                 and isinstance(c.rhs, WireExp) \
                 and c.rhs.op == 'Const':
-            for j,useCmd in enumerate(cmds):
-                if isinstance(useCmd, (DefCmd, AssignCmd)) \
-                        and isinstance(useCmd.rhs, WireExp):
-                    for ai,arg in enumerate(useCmd.rhs.args):
-                        if str(c.lhs) == str(arg):
-                            cmds[j].rhs.args[ai] = WireExp('Const', c.rhs.args)
+            for useCmd, ai in usesOf(c, (DefCmd, AssignCmd)):
+                useCmd.rhs.args[ai] = share(WireExp('Const', c.rhs.args))
             removeConsts.add(c)
-    for r in removeConsts:
-        cmds.remove(r)
+    cmds = [c for c in cmds if c not in removeConsts]
 
     removeConsts = set()
-    for i,c in enumerate(cmds):
+    for c in cmds:
+        if outOfTime():
+            break
         if isinstance(c, (DefCmd, AssignCmd)) \
                 and isinstance(c.rhs, WireExp) \
                 and c.rhs.op == 'c' \
                 and ['Const']*len(c.rhs.args) == [a.op for a in c.rhs.args if isinstance(a,WireExp)]:
-            for j,useCmd in enumerate(cmds):
-                if isinstance(useCmd, (DefCmd, AssignCmd)) \
-                        and isinstance(useCmd.rhs, WireExp):
-                    for ai,arg in enumerate(useCmd.rhs.args):
-                        if str(c.lhs) == str(arg):
-                            const_string = ''
-                            final_width = 0
-                            for a in c.rhs.args:
-                                val = int(str(a.args[0]))
-                                const_string = const_string + bin(val).replace('0b','')
-                                final_width += int(str(a.args[1]))
-                            constwire = pyrtl.Const(str(final_width) + "'b" + const_string)
-                            cmds[j].rhs.args[ai] = WireExp('Const', [Literal(str(constwire.val)), Literal(str(constwire.bitwidth))])
+            constwire = None
+            for useCmd, ai in usesOf(c, (DefCmd, AssignCmd)):
+                if constwire is None:
+                    const_string = ''
+                    final_width = 0
+                    for a in c.rhs.args:
+                        val = int(str(a.args[0]))
+                        const_string = const_string + bin(val).replace('0b','')
+                        final_width += int(str(a.args[1]))
+                    constwire = pyrtl.Const(str(final_width) + "'b" + const_string)
+                useCmd.rhs.args[ai] = share(WireExp('Const', [share(Literal(str(constwire.val))),
+                                                              share(Literal(str(constwire.bitwidth)))]))
             removeConsts.add(c)
-    for r in removeConsts:
-        cmds.remove(r)
+    cmds = [c for c in cmds if c not in removeConsts]
 
     if not foldSelects:
         return Block(cmds)
 
     # NOTE: fold select's with direct references to input wires or regs, then remove those temps
+    selectable = set(i[0].name for i in (ins + regs + tmps))
+    # the folded select's arguments are shared with the uses: convert_to_debruijn() rebuilds
+    # the uses it renames instead of modifying them
     removeSels = set()
-    for i,c in enumerate(cmds):
+    for c in cmds:
+        if outOfTime():
+            break
         if isinstance(c, (DefCmd)) \
                 and isinstance(c.rhs, WireExp) \
                 and c.rhs.op == 's' \
-                and str(c.rhs.args[0]) in [i[0].name for i in (ins + regs + tmps)]:
-            for j,useCmd in enumerate(cmds):
-                if isinstance(useCmd, (DefCmd)) \
-                        and isinstance(useCmd.rhs, WireExp):
-                    for ai,arg in enumerate(useCmd.rhs.args):
-                        if str(c.lhs) == str(arg):
-                            cmds[j].rhs.args[ai] = WireExp('s', [copy.deepcopy(x) for x in c.rhs.args])
-                            removeSels.add(c)
-    for r in removeSels:
-        cmds.remove(r)
+                and str(c.rhs.args[0]) in selectable:
+            for useCmd, ai in usesOf(c, DefCmd):
+                useCmd.rhs.args[ai] = share(WireExp('s', list(c.rhs.args)))
+                removeSels.add(c)
+    cmds = [c for c in cmds if c not in removeSels]
 
     return Block(cmds)
 
 
-def convert_to_debruijn(netlist):
-    
+# Renames the wire/var uses of the commands to De Bruijn indices (DbIndex) and their definitions
+# to their position. The renamed uses and the expressions on the path to them are rebuilt rather
+# than modified, so subexpressions shared between commands (see Interner) stay intact; with an
+# Interner, the rebuilt expressions are interned as well.
+def convert_to_debruijn(netlist, interner=None):
+    share = interner.intern if interner is not None else (lambda x: x)
     var = {}
 
     def renameVarUses(c, argOp, argIndex, cur_index):
         if isinstance(c, (AssignCmd, DefCmd)):
-            renameVarUses(c.rhs, None, None, cur_index)
-            return
+            c.rhs = renameVarUses(c.rhs, None, None, cur_index)
+            return c
         if isinstance(c, (WireExp, ValExp)):
-            for i,a in enumerate(c.args):
-                renameVarUses(a, c.op, i, cur_index)
-            return
+            args = [renameVarUses(a, c.op, i, cur_index) for i,a in enumerate(c.args)]
+            if any(x is not y for x, y in zip(args, c.args)):
+                c = c.replace(args=args)
+            return share(c)
         if isinstance(c, (Wire, Var)) and str(c.name) in var:
             if (argOp == 'array-ref' and argIndex == 0):
-                c.name = '{}'.format(var[str(c.name)] - cur_index)
+                name = DbIndex(var[str(c.name)] - cur_index, False)
             elif argOp == 's' and argIndex == 0:
-                c.name = '{}'.format(var[str(c.name)] - cur_index)
+                name = DbIndex(var[str(c.name)] - cur_index, False)
             elif argOp == 's' and argIndex and argIndex > 0:
-                c.name = '(& {})'.format(var[str(c.name)] - cur_index)
+                name = DbIndex(var[str(c.name)] - cur_index, True)
             elif argOp in ['a+','a-','a*','a/','a%']:
-                c.name = '(& {})'.format(var[str(c.name)] - cur_index)
+                name = DbIndex(var[str(c.name)] - cur_index, True)
             else:
-                c.name = '{}'.format(var[str(c.name)] - cur_index)
-            return
+                name = DbIndex(var[str(c.name)] - cur_index, False)
+            return share(c.replace(name=share(name)))
         if isinstance(c, WireSlice):
-            for h in c.vexps:
-                renameVarUses(h, 's', None, cur_index)
-            return
+            vexps = [renameVarUses(h, 's', None, cur_index) for h in c.vexps]
+            if any(x is not y for x, y in zip(vexps, c.vexps)):
+                c = c.replace(vexps=vexps)
+            return share(c)
         if isinstance(c, ForCmd):
             for b in c.body.cmds:
                 renameVarUses(b, None, None, cur_index)
-            return
-        return
+            return c
+        return c
 
     for index, cmd in enumerate(netlist.cmds):
         if isinstance(cmd, (DefCmd, AssignCmd)):
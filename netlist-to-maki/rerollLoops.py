@@ -1,255 +1,338 @@
-from netlistToMaki import ForCmd, Block, AssignCmd, DefCmd, Wire, Var, WireExp, ValExp, WireSlice, VarIndex, ArrayCreate, Literal
-import copy
+from netlistToMaki import ForCmd, Block, AssignCmd, DefCmd, Wire, Var, WireExp, ValExp, WireSlice, VarIndex, ArrayCreate, Literal, DbIndex
 
-def reroll_loops(maki_prog, loops):
+# Rerolls the loop candidates found by find_loops() in a De Bruijn indexed Maki program.
+# engine 'batched' applies every non-overlapping candidate in one pass (reroll_loops_batched);
+# engine 'single' only applies loops[1] with insert_loop(), as the original rerolling did.
+# loops may also be the nodes of find_loop_hierarchy() (body lengths counting the commands
+# with nested loops unrolled): their nested loops are rerolled inside the loop bodies.
+def reroll_loops(maki_prog, loops, engine='batched'):
+    if engine == 'batched':
+        return reroll_loops_batched(maki_prog, loops)
+    elif engine != 'single':
+        raise ValueError('unknown rerolling engine: {}'.format(engine))
     for loop in loops[1:]:
         prog_with_loop = insert_loop(maki_prog, loop[0], loop[1], loop[2])
         return prog_with_loop
 
-def fix_inner_deps(for_cmd, for_start, og_maki_prog):
-    og_block = og_maki_prog
-    og_maki_prog = og_maki_prog.cmds
-    body = for_cmd.body.cmds
-    to_add = []
-    added = {}
-    to_fix = []
-
-    def fix_var(var, var_next, cur_index, c):
-        if abs(int(var)) >= cur_index and var == var_next:
-            origional_var = og_maki_prog[for_start + cur_index + int(var)].lhs.name
-            if origional_var in added:
-                return -cur_index - added[origional_var] - 1
-            new_dist = -cur_index - len(to_add) - 2
-            to_add.append(DefCmd(Var('none', ''), (for_start + cur_index + int(var)) - (for_start - len(to_add))) )
-            added[origional_var] = len(to_add) - 1
-            assign_location = len(body) + cur_index + int(var)
-            for_cmd.body.cmds[assign_location] = AssignCmd(-assign_location - len(to_add) - 2, for_cmd.body.cmds[assign_location].rhs)
-            return new_dist
-        elif (abs(int(var)) >= cur_index):
-            to_fix.append(c)
-        return var
-            
-            
-    def renameVarUses(c, c_next, argOp, argIndex, cur_index):
-        if isinstance(c, (AssignCmd, DefCmd)):
-            renameVarUses(c.rhs, c_next.rhs, None, None, cur_index)
-            return
-        if isinstance(c, (WireExp, ValExp)):
-            for i,a in enumerate(c.args):
-                renameVarUses(a, c_next.args[i], c.op, i, cur_index)
-            return
-        if isinstance(c, (Wire, Var)):
-            if (argOp == 'array-ref' and argIndex == 0):
-                c.name = '{}'.format(fix_var(c.name, c_next.name, cur_index, c))
-            elif argOp == 's' and argIndex == 0:
-                c.name = '{}'.format(fix_var(c.name, c_next.name, cur_index, c))
-            elif argOp == 's' and argIndex and argIndex > 0:
-                c.name = '(& {})'.format(fix_var(c.name, c_next.name, cur_index, c))
-            elif argOp in ['a+','a-','a*','a/','a%']:
-                c.name = '(& {})'.format(fix_var(c.name, c_next.name, cur_index, c))
-            else:
-                c.name = '{}'.format(fix_var(c.name, c_next.name, cur_index, c))
-            return
-        if isinstance(c, WireSlice):
-            if c_next.vexps[0] != c.vexps[0]:
-                c.vexps[0] = for_cmd.index
-            for i, h in enumerate(c.vexps):
-                renameVarUses(h, c_next.vexps[i], 's', None, cur_index)
-            return
-        if isinstance(c, ForCmd):
-            for i, b in enumerate(c.body.cmds):
-                renameVarUses(b, c.body.cmds[i], None, None, cur_index)
-            return
-        return
-    
-    for i, cmd in enumerate(body):
-        renameVarUses(cmd, og_maki_prog[for_start + i + len(body)], None, None, i)
-    
-    for c in to_fix:
-        c.name = str(int(c.name) - len(to_add) - 1)
-
-    for c in to_add:
-        insert_cmd(og_block, for_start, c)
-    
-    return (to_add, og_block)
-
-def insert_cmd(maki_prog, index, cmd):
-
-    def add_one(var, ref_index, cur_index):
-        if int(var) + cur_index < ref_index:
-            return int(var) - 1
-        return int(var)
-
-    def edit_debruijn_index(c, argOp, argIndex, ref_index, cur_index):
-        if isinstance(c, (AssignCmd, DefCmd)):
-            edit_debruijn_index(c.rhs, None, None, ref_index, cur_index)
-            return
-        if isinstance(c, (WireExp, ValExp)):
-            for i,a in enumerate(c.args):
-                edit_debruijn_index(a, c.op, i, ref_index, cur_index)
-            return
-        if isinstance(c, (Wire, Var)):
-            if (argOp == 'array-ref' and argIndex == 0):
-                c.name = '{}'.format(add_one(c.name, ref_index, cur_index))
-            elif argOp == 's' and argIndex == 0:
-                c.name = '{}'.format(add_one(c.name, ref_index, cur_index))
-            elif argOp == 's' and argIndex and argIndex > 0:
-                c.name = '(& {})'.format(add_one(c.name, ref_index, cur_index))
-            elif argOp in ['a+','a-','a*','a/','a%']:
-                c.name = '(& {})'.format(add_one(c.name, ref_index, cur_index))
-            else:
-                c.name = '{}'.format(add_one(c.name, ref_index, cur_index))
-            return
-        if isinstance(c, WireSlice):
-            # if c_next.vexps[0] != c.vexps[0]:
-            #     c.vexps[0] = for_cmd.index
-            for i, h in enumerate(c.vexps):
-                edit_debruijn_index(h, 's', None, ref_index, cur_index)
-            return
-        if isinstance(c, ForCmd):
-            for i, b in enumerate(c.body.cmds):
-                edit_debruijn_index(b, None, None, ref_index, cur_index)
-            return
-        return
-
-    maki_prog.cmds = maki_prog.cmds[:index] + [cmd] + maki_prog.cmds[index:]
-    for i in range(index + 1, len(maki_prog.cmds)):
-        edit_debruijn_index(maki_prog.cmds[i], None, None, index, i)
-
-def fix_after_deps(maki_prog, for_cmd, for_start):
-    loop_size = len(for_cmd.body.cmds)
-    loop_iters = for_cmd.range
-    loop_end = for_start + (loop_size * loop_iters)
-
-    new_arrays = []
-    new_array_inserts = []
-    new_array_lines = set()
-
-    def fix_var(var, cur_index, c):
-        index = cur_index + int(var) + (loop_size*loop_iters - (1))
-        if index >= for_start and index < for_start + (loop_size * loop_iters):
-            which_iter = 0
-            current = for_start
-            for i in range(loop_iters):
-                current += loop_size
-                if current > index:
-                    which_iter = i
-                    spot = index - (current-loop_size)
-                    break
-            if (spot in new_array_lines):
-                return
-            new_arrays.append(DefCmd('Array', ArrayCreate(loop_iters)))
-            new_array_inserts.append((spot+1, AssignCmd(str(-2-spot-len(new_arrays)), WireExp('array-store', ['i', Var(-1)]))))
-            for ai,arg in enumerate(maki_prog.cmds[cur_index].rhs.args):
-                if str(var) == str(arg):
-                    maki_prog.cmds[cur_index].rhs.args = maki_prog.cmds[cur_index].rhs.args[:ai] + [WireExp('array-ref', [Var(for_start-cur_index-len(new_arrays)), WireSlice([which_iter])])] + maki_prog.cmds[cur_index].rhs.args[ai:]
-            new_array_lines.add(spot)
-        elif index < for_start:
-            c.name = str(int(c.name) + loop_size*loop_iters - 1)
-
-    def add_array_refs(c, argOp, argIndex, cur_index):
+# Collects the De Bruijn indexed Wire/Var uses and the WireSlices of a command, in walk order.
+def collect_uses(c, uses=None, slices=None):
+    if uses is None:
+        uses, slices = [], []
+    if isinstance(c, (AssignCmd, DefCmd)):
+        collect_uses(c.rhs, uses, slices)
+    elif isinstance(c, (WireExp, ValExp)):
+        for a in c.args:
+            collect_uses(a, uses, slices)
+    elif isinstance(c, (Wire, Var)):
+        if isinstance(c.name, DbIndex):
+            uses.append(c)
+    elif isinstance(c, WireSlice):
+        slices.append(c)
+        for h in c.vexps:
+            collect_uses(h, uses, slices)
+    return uses, slices
+
+# Rebuilds a command with on_use(node, k) applied to its k-th De Bruijn indexed Wire/Var
+# and on_slice(node, vexps, k) to the (already rebuilt) vexps of its k-th WireSlice,
+# numbered in the same walk order as collect_uses().
+# Nodes are only copied on the path to a replaced node; everything else is shared with c,
+# so c itself is never modified.
+def rewrite(c, on_use, on_slice=None):
+    counts = [0, 0]
+
+    def walk(c):
         if isinstance(c, (AssignCmd, DefCmd)):
-            add_array_refs(c.rhs, None, None, cur_index)
-            return
+            rhs = walk(c.rhs)
+            return c if rhs is c.rhs else c.replace(rhs=rhs)
         if isinstance(c, (WireExp, ValExp)):
-            for i,a in enumerate(c.args):
-                add_array_refs(a, c.op, i, cur_index)
-            return
+            args = [walk(a) for a in c.args]
+            if all(x is y for x, y in zip(args, c.args)):
+                return c
+            return c.replace(args=args)
         if isinstance(c, (Wire, Var)):
-            if (argOp == 'array-ref' and argIndex == 0):
-                fix_var(c.name, cur_index, c)
-            elif argOp == 's' and argIndex == 0:
-                fix_var(c.name, cur_index, c)
-            elif argOp == 's' and argIndex and argIndex > 0:
-                fix_var(c.name, cur_index, c)
-            elif argOp in ['a+','a-','a*','a/','a%']:
-                fix_var(c.name, cur_index, c)
-            else:
-                fix_var(c.name, cur_index, c)
-            return
+            if isinstance(c.name, DbIndex):
+                counts[0] += 1
+                return on_use(c, counts[0] - 1)
+            return c
         if isinstance(c, WireSlice):
-            # if c_next.vexps[0] != c.vexps[0]:
-            #     c.vexps[0] = for_cmd.index
-            for i, h in enumerate(c.vexps):
-                add_array_refs(h, 's', None, cur_index)
-            return
-        if isinstance(c, ForCmd):
-            for i, b in enumerate(c.body.cmds):
-                add_array_refs(b, None, None, cur_index)
-            return
-        return
-
-    for i in range(for_start + 1, len(maki_prog.cmds)):
-        add_array_refs(maki_prog.cmds[i], None, None, i)
-    
-    for c in new_arrays:
-        insert_cmd(maki_prog, for_start, c)
-
-    for i, c in new_array_inserts:
-        insert_cmd(for_cmd.body, i, c)
+            k = counts[1]
+            counts[1] += 1
+            vexps = [walk(h) for h in c.vexps]
+            if on_slice is not None:
+                vexps = on_slice(c, vexps, k)
+            if all(x is y for x, y in zip(vexps, c.vexps)):
+                return c
+            return c.replace(vexps=vexps)
+        return c
 
-def debruijn_to_reg(db_prog):
+    return walk(c)
 
-    def adjust(dbi, cur_index, in_for):
-        if abs(dbi) <= in_for:
-            return '{}.{}'.format(cur_index - in_for - 1, in_for + dbi)
-        return dbi + cur_index
+# Picks the loop candidates to apply: each (start name, body size, iterations, ...) is resolved
+# to its first command, and candidates are taken largest span first, skipping any that
+# overlap an already taken one or run past the end of the program.
+# The nested loops of a candidate (the children of a find_loop_hierarchy() node) are picked
+# the same way within its first iteration.
+# Returns (first command, body size, iterations, enclosing loop) tuples sorted by first command,
+# the enclosing loop being an index into the result (None at the top level) that always comes
+# before the loops nested in it.
+def select_loops(cmds, loops):
+    first = {}
+    for i, c in enumerate(cmds):
+        if isinstance(c, (DefCmd, AssignCmd)):
+            first.setdefault(str(c.lhs), i)
+    selected = []
 
-    def renameVarUses(c, argOp, argIndex, cur_index, in_for):
-        if isinstance(c, (AssignCmd, DefCmd)):
-            renameVarUses(c.rhs, None, None, cur_index, in_for)
-            return
-        if isinstance(c, (WireExp, ValExp)):
-            for i,a in enumerate(c.args):
-                renameVarUses(a, c.op, i, cur_index, in_for)
-            return
-        if isinstance(c, (Wire, Var)):
-            if (argOp == 'array-ref' and argIndex == 0):
-                c.name = '{}'.format(adjust(int(c.name), cur_index, in_for))
-            elif argOp == 's' and argIndex == 0:
-                c.name = '{}'.format(adjust(int(c.name), cur_index, in_for))
-            elif argOp == 's' and argIndex and argIndex > 0:
-                c.name = '(& {})'.format(adjust(int(c.name), cur_index, in_for))
-            elif argOp in ['a+','a-','a*','a/','a%']:
-                c.name = '(& {})'.format(adjust(int(c.name), cur_index, in_for))
+    def select(loops, lo, hi, parent):
+        spans = []
+        for loop in loops:
+            start, size, iters = loop[0], loop[1], loop[2]
+            s = first.get(str(start))
+            if s is not None and size > 0 and iters > 1 and lo <= s and s + size * iters <= hi:
+                spans.append((s, size, iters, loop[3] if len(loop) > 3 else []))
+        taken = [False] * (hi - lo)
+        picked = []
+        for s, size, iters, children in sorted(spans, key=lambda x: (-x[1] * x[2], x[0])):
+            if any(taken[s - lo:s - lo + size * iters]):
+                continue
+            taken[s - lo:s - lo + size * iters] = [True] * (size * iters)
+            picked.append((s, size, iters, children))
+        for s, size, iters, children in sorted(picked, key=lambda x: x[0]):
+            selected.append((s, size, iters, parent))
+            select(children, s, s + size, len(selected) - 1)
+
+    select(loops, 0, len(cmds), None)
+    return selected
+
+# Name of the index variable of a loop nested depth loops deep.
+def loop_index(depth):
+    return 'ijklmn'[depth] if depth < 6 else 'i{}'.format(depth)
+
+# Applies every non-overlapping loop candidate in one pass.
+# Every use is first resolved to the command it reads (a position in the original program,
+# or a new command, keyed ('init'|'array'|'store', loop, ...)). The loops are then rewritten:
+#   - a body use that reads before the loop with the same offset in the second iteration
+#     is loop carried: it reads a new init definition placed before the loop, and the body
+#     command it reads on later iterations becomes an assignment to that definition;
+#   - a use from outside a loop of a command inside it reads an array filled by an
+#     array-store placed after that command in the loop body (after the nested loop holding
+#     it, which the store then reads through the nested loop's own array);
+#   - a slice of a body command that differs in the second iteration is indexed by the loop
+#     variable of the innermost loop it differs in.
+# Nested loops are rerolled inside the body of the loop holding them.
+# The new layout is walked once to build a position table (body commands of a ForCmd at f
+# sit at f + 1 + i), and the commands are rebuilt with rewrite() with their indices recomputed
+# from it. The input program is not modified: unchanged commands and subexpressions are shared.
+def reroll_loops_batched(maki_prog, loops):
+    cmds = maki_prog.cmds
+    n = len(cmds)
+    selected = select_loops(cmds, loops)
+
+    # innermost loop of every command, and whether it lies past the first iteration of a loop
+    loop_of = [None] * n
+    dropped = [False] * n
+    for li, (s, size, iters, _) in enumerate(selected):
+        loop_of[s:s + size * iters] = [li] * (size * iters)
+        dropped[s + size:s + size * iters] = [True] * (size * (iters - 1))
+
+    def enclosing(li):
+        chain = []
+        while li is not None:
+            chain.append(li)
+            li = selected[li][3]
+        return chain
+
+    # loops holding a reader, innermost first
+    def scope(x):
+        if isinstance(x, int):
+            return enclosing(loop_of[x])
+        if x[0] == 'init':
+            return enclosing(selected[x[1]][3])
+        return enclosing(x[1])
+
+    uses, slices = zip(*[collect_uses(c) for c in cmds]) if cmds else ((), ())
+
+    # (reader, use number) -> original position, new command key or ('read', array key, iteration)
+    reads = {}
+    for i in range(n):
+        if dropped[i]:
+            continue
+        for k, node in enumerate(uses[i]):
+            t = i + node.name.offset
+            if 0 <= t < n:
+                reads[(i, k)] = t
+
+    inits = [[] for _ in selected]
+    arrays = [dict() for _ in selected]
+    assigns = {}
+
+    # loop carried dependencies
+    for li, (s, size, iters, _) in enumerate(selected):
+        for i in range(s, s + size):
+            if dropped[i]:
+                continue
+            nxt = uses[i + size]
+            for k, node in enumerate(uses[i]):
+                t = i + node.name.offset
+                if t >= s or reads.get((i, k)) != t:
+                    continue
+                if k >= len(nxt) or nxt[k].name.offset != node.name.offset or t + size < s:
+                    continue
+                # a command of a nested loop runs more than once per iteration
+                if loop_of[t + size] != li:
+                    continue
+                init = ('init', li, t)
+                if t + size not in assigns:
+                    inits[li].append(init)
+                    reads[(init, 0)] = t
+                    assigns[t + size] = init
+                reads[(i, k)] = init
+
+    # uses of loop commands from outside their loop read from per-command arrays
+    # of the outermost loop the reader is not in
+    pending = list(reads.items())
+    for key, dst in pending:
+        if not isinstance(dst, int) or loop_of[dst] is None:
+            continue
+        inside = scope(key[0])
+        escaped = [li for li in enclosing(loop_of[dst]) if li not in inside]
+        if not escaped:
+            continue
+        li = escaped[-1]
+        s, size, iters, _ = selected[li]
+        spot = (dst - s) % size
+        if spot not in arrays[li]:
+            arrays[li][spot] = ('array', li, spot)
+            store = ('store', li, spot)
+            reads[(store, 0)] = s + spot
+            pending.append(((store, 0), s + spot)) # read in turn, from the loop of the store
+        reads[key] = ('read', arrays[li][spot], (dst - s) // size)
+
+    # new layout and position table: the items of the loop li (None for the program) over
+    # the commands lo..hi, the first one at position first
+    pos = [None] * n
+    new_pos = {}
+    starts = {(parent, s): li for li, (s, _, _, parent) in enumerate(selected)}
+
+    def lay_out(lo, hi, li, first):
+        items = []
+        i = lo
+        while i < hi:
+            if (li, i) not in starts:
+                pos[i] = first + len(items)
+                items.append(i)
+                if li is not None and i - selected[li][0] in arrays[li]:
+                    store = ('store', li, i - selected[li][0])
+                    new_pos[store] = first + len(items)
+                    items.append(store)
+                i += 1
+                continue
+            inner = starts[(li, i)]
+            s, size, iters, _ = selected[inner]
+            for key in inits[inner] + list(arrays[inner].values()):
+                new_pos[key] = first + len(items)
+                items.append(key)
+            f = first + len(items)
+            items.append(('for', inner, lay_out(s, s + size, inner, f + 1)))
+            i = s + size * iters
+            if li is not None:
+                for spot in range(s - selected[li][0], i - selected[li][0]):
+                    if spot in arrays[li]:
+                        new_pos[('store', li, spot)] = first + len(items)
+                        items.append(('store', li, spot))
+        return items
+
+    layout = lay_out(0, n, None, 0)
+
+    def position(x):
+        return pos[x] if isinstance(x, int) else new_pos[x]
+
+    def read(src, k, node):
+        dst = reads.get((src, k))
+        if dst is None:
+            return node
+        if isinstance(dst, tuple) and dst[0] == 'read':
+            array = Var(DbIndex(position(dst[1]) - position(src), False), [])
+            return WireExp('array-ref', [array, WireSlice([dst[2]])])
+        offset = position(dst) - position(src)
+        if offset == node.name.offset:
+            return node
+        return node.replace(name=DbIndex(offset, node.name.addr))
+
+    def rebuilt(i):
+        on_slice = None
+        nexts = [(slices[i + selected[li][1]], loop_index(len(enclosing(li)) - 1)) for li in enclosing(loop_of[i])]
+        if nexts:
+            def on_slice(node, vexps, k):
+                for nxt, index in nexts:
+                    if k < len(nxt) and vexps and nxt[k].vexps and nxt[k].vexps[0] != node.vexps[0]:
+                        return [index] + vexps[1:]
+                return vexps
+        c = rewrite(cmds[i], lambda node, k: read(i, k, node), on_slice)
+        if i in assigns:
+            c = AssignCmd(DbIndex(position(assigns[i]) - pos[i], False), c.rhs)
+        return c
+
+    def built(items):
+        new_cmds = []
+        for x in items:
+            if isinstance(x, int):
+                new_cmds.append(rebuilt(x))
+            elif x[0] == 'init':
+                new_cmds.append(DefCmd(Var('none', ''), read(x, 0, Var(DbIndex(None, False), []))))
+            elif x[0] == 'array':
+                new_cmds.append(DefCmd('Array', ArrayCreate(selected[x[1]][2])))
+            elif x[0] == 'store':
+                li, spot = x[1], x[2]
+                new_cmds.append(AssignCmd(DbIndex(position(arrays[li][spot]) - position(x), False),
+                    WireExp('array-store', [loop_index(len(enclosing(li)) - 1), read(x, 0, Var(DbIndex(None, False), []))])))
             else:
-                c.name = '{}'.format(adjust(int(c.name), cur_index, in_for))
-            return
-        if isinstance(c, WireSlice):
-            # if c_next.vexps[0] != c.vexps[0]:
-            #     c.vexps[0] = for_cmd.index
-            for i, h in enumerate(c.vexps):
-                renameVarUses(h, 's', None, cur_index, in_for)
-            return
-        if isinstance(c, ForCmd):
-            for i, b in enumerate(c.body.cmds):
-                if isinstance(b, DefCmd):
-                    b.lhs = '{}.{}'.format(cur_index, i)
-                elif isinstance(b, AssignCmd):
-                    b.lhs = int(b.lhs) + (i+1+cur_index)
-                renameVarUses(b, None, None, i+1+cur_index, i)
-            return
-        return
+                li = x[1]
+                new_cmds.append(ForCmd(loop_index(len(enclosing(li)) - 1), selected[li][2], Block(built(x[2]))))
+        return new_cmds
 
-    for i, cmd in enumerate(db_prog.cmds):
-        cmd.lhs = str(i)
-        renameVarUses(cmd, None, None, i, -1)
-        
+    return debruijn_to_reg(Block(built(layout)))
 
+# Rerolls a single loop candidate, see reroll_loops_batched().
 def insert_loop(maki_prog, start, size, num_iters):
-    og_maki_prog = copy.deepcopy(maki_prog)
-    block_cmds = maki_prog.cmds
-    line_start = -1
-    for i, cmd in enumerate(block_cmds):
-        if str(start) == str(cmd.lhs):
-            line_start = i
-            break
-    if line_start == -1:
-        exit(-1)
-    for_cmd = ForCmd('i', num_iters, Block(block_cmds[line_start:line_start+size]))
-    to_add, maki_prog = fix_inner_deps(for_cmd, line_start, og_maki_prog)
-    line_start = line_start + len(to_add)
-    maki_prog = Block(maki_prog.cmds[:line_start] + [for_cmd] + maki_prog.cmds[line_start+size*num_iters:])
-    fix_after_deps(maki_prog, for_cmd, line_start)
-    debruijn_to_reg(maki_prog)
-    return maki_prog
\ No newline at end of file
+    return reroll_loops_batched(maki_prog, [(start, size, num_iters)])
+
+# Renames the De Bruijn indices of a rerolled program to the positions (or 'loop.body' positions,
+# 'loop.body.body' in nested loops) of the commands they refer to.
+# Returns a new program; db_prog is not modified.
+def debruijn_to_reg(db_prog):
+
+    # name of position t seen from inside the loops (ForCmd position, name) of scopes, outermost first
+    def name(t, scopes):
+        for f, prefix in reversed(scopes):
+            if t > f:
+                return '{}.{}'.format(prefix, t - f - 1)
+        return t
+
+    def renameVarUses(c, cur_index, scopes):
+        return rewrite(c, lambda v, k: v.replace(name=v.name.render(name(cur_index + v.name.offset, scopes))))
+
+    def renameBody(loop, f, prefix, scopes):
+        scopes = scopes + [(f, prefix)]
+        body = []
+        for j, b in enumerate(loop.body.cmds):
+            cur_index = f + 1 + j
+            if isinstance(b, ForCmd):
+                body.append(b.replace(body=renameBody(b, cur_index, '{}.{}'.format(prefix, j), scopes)))
+                continue
+            b = renameVarUses(b, cur_index, scopes)
+            if isinstance(b, DefCmd):
+                b = b.replace(lhs='{}.{}'.format(prefix, j))
+            elif isinstance(b, AssignCmd) and isinstance(b.lhs, DbIndex):
+                b = b.replace(lhs=name(b.lhs.offset + cur_index, scopes))
+            elif isinstance(b, AssignCmd):
+                b = b.replace(lhs=int(b.lhs) + cur_index)
+            body.append(b)
+        return Block(body)
+
+    cmds = []
+    for i, cmd in enumerate(db_prog.cmds):
+        if isinstance(cmd, ForCmd):
+            cmds.append(cmd.replace(body=renameBody(cmd, i, i, [])))
+        else:
+            cmds.append(renameVarUses(cmd, i, []).replace(lhs=str(i)))
+    return Block(cmds)
@@ -0,0 +1,166 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import sys
+import time
+import traceback
+import pyrtl
+from main import run_benchmark
+from netlistCache import NetlistCache
+from instrument import Trace
+from budget import Deadline
+
+# Parallel replacement for run-ntom-for-benchmark.sh.
+# PyRTL and the converter are imported once here; every BLIF then runs in its own
+# forked process (a fresh PyRTL working block, its own address space limit), at most
+# --jobs at a time. A job that runs past --timeout is killed; --budget instead lets the
+# pipeline stop by itself and write its partial results.
+# Prints one line per finished job and writes a JSON summary:
+#   {blif, status: ok|partial|timeout|oom|error, wall, phases: {phase: seconds}, counts, loops, cache, error}
+
+BLIFS = 'basejump-netlists'
+RESULTS = 'results'
+RESULTS_REROLLED = 'results_rerolled'
+
+def read_patterns(benchmarks_list):
+    with open(benchmarks_list) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def find_blifs(patterns):
+    blifs = []
+    for pattern in patterns:
+        for blif in sorted(glob.glob(os.path.join(BLIFS, pattern + '*.blif'))):
+            if blif not in blifs:
+                blifs.append(blif)
+    return blifs
+
+# Runs in the forked child: converts one BLIF and sends its summary back through conn.
+def run_job(conn, blif, clock, format, mem_limit, cache, profile, budget, loop_engine, frontend, intern,
+            max_period, window, cleanup='defs'):
+    summary = {'blif': blif, 'status': 'ok', 'phases': {}, 'loops': None, 'error': None}
+    try:
+        if mem_limit:
+            limit = mem_limit * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        pyrtl.reset_working_block()
+        trace = Trace()
+        try:
+            run_benchmark(blif, clock, format, trace, cache, profile, Deadline(budget), loop_engine, frontend,
+                          intern, max_period, window, cleanup)
+            if 'budget_exhausted' in trace.info:
+                summary['status'] = 'partial'
+        finally:
+            summary['loops'] = trace.counts.get('loops_found')
+            summary['cache'] = trace.info.get('cache')
+            summary['phases'] = trace.phases
+            summary['counts'] = trace.counts
+    except MemoryError:
+        summary['status'] = 'oom'
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = '{}: {}'.format(type(e).__name__, e)
+        traceback.print_exc()
+    conn.send(summary)
+    conn.close()
+
+# Keeps up to jobs children running; returns the summaries in the order of blifs.
+def run_all(blifs, clock, format, jobs, timeout, mem_limit, cache=None, profile=False, budget=None,
+            loop_engine='runs', frontend='pyrtl', intern=False, max_period=128, window=None, cleanup='defs'):
+    ctx = multiprocessing.get_context('fork')
+    pending = list(enumerate(blifs))
+    running = {}
+    summaries = [None] * len(blifs)
+    while pending or running:
+        while pending and len(running) < jobs:
+            i, blif = pending.pop(0)
+            recv, send = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=run_job, args=(send, blif, clock, format, mem_limit, cache, profile, budget,
+                                                  loop_engine, frontend, intern, max_period, window, cleanup))
+            p.start()
+            send.close()
+            running[i] = (p, recv, time.perf_counter())
+
+        multiprocessing.connection.wait([recv for _, recv, _ in running.values()], timeout=1)
+        now = time.perf_counter()
+        for i, (p, recv, start) in list(running.items()):
+            summary = None
+            if recv.poll():
+                try:
+                    summary = recv.recv()
+                except EOFError:
+                    summary = {'blif': blifs[i], 'status': 'oom' if mem_limit else 'error',
+                               'phases': {}, 'loops': None,
+                               'error': 'worker exited without a result'}
+            elif timeout and now - start > timeout:
+                p.kill()
+                summary = {'blif': blifs[i], 'status': 'timeout', 'phases': {}, 'loops': None,
+                           'error': 'killed after {}s'.format(timeout)}
+            if summary is None:
+                continue
+            p.join()
+            recv.close()
+            summary['wall'] = now - start
+            summaries[i] = summary
+            del running[i]
+            print('{:<70} {:>8} {:>9.2f}s  loops: {}'.format(
+                os.path.basename(blifs[i]), summary['status'], summary['wall'], summary['loops']),
+                flush=True)
+    return summaries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a benchmarks list of BLIFs to Maki in parallel.')
+    parser.add_argument('list', help='benchmarks list (e.g. benchmarks/BENCHMARKS-SMALL)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help='number of BLIFs converted at once (default: all cores)')
+    parser.add_argument('--timeout', type=float, default=3600,
+                        help='wall-clock limit per BLIF in seconds (0: no limit)')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='time budget per BLIF in seconds, after which partial results are written (status partial)')
+    parser.add_argument('--loop-engine', default='runs', choices=('runs', 'naive', 'hierarchy', 'bounded'),
+                        help='loop identification engine (hierarchy: all nesting levels in one pass, '
+                             'bounded: no suffix array, loop bodies of at most --max-period commands)')
+    parser.add_argument('--max-period', type=int, default=128,
+                        help='longest loop body, in commands, the bounded engine (or --window) looks for')
+    parser.add_argument('--window', type=int, default=0,
+                        help='find loops over overlapping windows of this many commands (0: whole program)')
+    parser.add_argument('--frontend', default='pyrtl', choices=('pyrtl', 'stream'),
+                        help='BLIF import: pyrtl.input_from_blif, or the streaming blifFrontend')
+    parser.add_argument('--cleanup', default='defs', choices=('defs', 'pyrtl'),
+                        help='netlist cleanup: one pass over the def map, or the PyRTL wire removal and '
+                             'combine_slice_concats (--frontend pyrtl only)')
+    parser.add_argument('--intern', action='store_true',
+                        help='share structurally equal subexpressions of the AST (less memory on large netlists)')
+    parser.add_argument('--mem-limit', type=int, default=0,
+                        help='address space limit per BLIF in MiB (0: no limit)')
+    parser.add_argument('--clock', default='clk')
+    parser.add_argument('--format', default='-pyrtl', choices=('-pyrtl', '-sv'))
+    parser.add_argument('--cache-dir', help='cache converted netlists in this directory')
+    parser.add_argument('--cache-size', type=int, default=1024, help='cache size limit in MiB')
+    parser.add_argument('--profile', action='store_true',
+                        help='write cProfile stats of each BLIF to results/<name>.prof')
+    parser.add_argument('--summary', default=os.path.join(RESULTS, 'summary.json'),
+                        help='where to write the JSON summary')
+    args = parser.parse_args()
+
+    os.makedirs(RESULTS, exist_ok=True)
+    os.makedirs(RESULTS_REROLLED, exist_ok=True)
+
+    cache = None
+    if args.cache_dir:
+        cache = NetlistCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    blifs = find_blifs(read_patterns(args.list))
+    summaries = run_all(blifs, args.clock, args.format, max(1, args.jobs), args.timeout, args.mem_limit, cache,
+                        args.profile, args.budget, args.loop_engine, args.frontend, args.intern,
+                        args.max_period, args.window, args.cleanup)
+    with open(args.summary, 'w') as f:
+        json.dump(summaries, f, indent=2)
+
+    failed = [s for s in summaries if s['status'] != 'ok']
+    print('{} of {} BLIFs converted, summary in {}'.format(
+        len(summaries) - len(failed), len(summaries), args.summary))
+    sys.exit(1 if failed else 0)
@@ -1,9 +1,186 @@
 from collections import defaultdict
+from array import array
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # naive way to build suffix array
-def suffix_array(s):
+# (kept as the 'naive' engine for cross-checking the faster builders);
+# int arrays are compared numerically, other token streams by str()
+def suffix_array_naive(s):
+    if isinstance(s, array):
+        return sorted(range(len(s)), key=lambda i: s[i:].tolist())
     return sorted(range(len(s)), key=lambda i: str(s[i:]))
 
+# Map a token stream onto a dense integer alphabet 1..k (0 is left free for the sentinel).
+# Interned id streams (array('i')) keep their numeric order; other tokens are ranked
+# by repr so the order stays close to the one used by suffix_array_naive.
+# Returns (list of ints, alphabet size including the sentinel).
+def int_alphabet(s):
+    alphabet = sorted(set(s)) if isinstance(s, array) else sorted(set(s), key=repr)
+    ids = {t: i + 1 for i, t in enumerate(alphabet)}
+    return [ids[t] for t in s], len(ids) + 1
+
+# SA-IS (Nong, Zhang & Chan): linear time suffix array construction.
+# s is a list of ints in [0, k) that ends with a unique smallest sentinel 0.
+def _sais(s, k):
+    n = len(s)
+    if n == 1:
+        return [0]
+
+    # suffix types: True for S-type, False for L-type
+    stype = [False] * n
+    stype[-1] = True
+    for i in range(n - 2, -1, -1):
+        stype[i] = s[i] < s[i + 1] or (s[i] == s[i + 1] and stype[i + 1])
+
+    def is_lms(i):
+        return i > 0 and stype[i] and not stype[i - 1]
+
+    counts = [0] * k
+    for c in s:
+        counts[c] += 1
+
+    def bucket_heads():
+        heads = [0] * k
+        total = 0
+        for c in range(k):
+            heads[c] = total
+            total += counts[c]
+        return heads
+
+    def bucket_tails():
+        tails = [0] * k
+        total = 0
+        for c in range(k):
+            total += counts[c]
+            tails[c] = total
+        return tails
+
+    # place the LMS suffixes at the ends of their buckets (in the given order),
+    # then induce L-type suffixes left to right and S-type suffixes right to left
+    def induce(lms_order):
+        sa = [-1] * n
+        tails = bucket_tails()
+        for i in reversed(lms_order):
+            c = s[i]
+            tails[c] -= 1
+            sa[tails[c]] = i
+        heads = bucket_heads()
+        for j in range(n):
+            i = sa[j] - 1
+            if i >= 0 and not stype[i]:
+                c = s[i]
+                sa[heads[c]] = i
+                heads[c] += 1
+        tails = bucket_tails()
+        for j in range(n - 1, -1, -1):
+            i = sa[j] - 1
+            if i >= 0 and stype[i]:
+                c = s[i]
+                tails[c] -= 1
+                sa[tails[c]] = i
+        return sa
+
+    def lms_equal(a, b):
+        if a == n - 1 or b == n - 1:
+            return False
+        j = 0
+        while True:
+            a_lms = is_lms(a + j)
+            b_lms = is_lms(b + j)
+            if j > 0 and a_lms and b_lms:
+                return True
+            if a_lms != b_lms or s[a + j] != s[b + j] or stype[a + j] != stype[b + j]:
+                return False
+            j += 1
+
+    lms = [i for i in range(1, n) if is_lms(i)]
+    sa = induce(lms)
+
+    # name the sorted LMS substrings; equal substrings share a name
+    names = [-1] * n
+    name = -1
+    prev = -1
+    for i in sa:
+        if not is_lms(i):
+            continue
+        if prev == -1 or not lms_equal(prev, i):
+            name += 1
+        names[i] = name
+        prev = i
+
+    # sort the LMS suffixes, recursing on the reduced string when names collide
+    reduced = [names[i] for i in lms]
+    if name + 1 == len(lms):
+        reduced_sa = [0] * len(lms)
+        for i, c in enumerate(reduced):
+            reduced_sa[c] = i
+    else:
+        reduced_sa = _sais(reduced, name + 1)
+
+    return induce([lms[i] for i in reduced_sa])
+
+# linear time suffix array over the integer alphabet of s
+def suffix_array_sais(s):
+    if not s:
+        return []
+    ints, k = int_alphabet(s)
+    ints.append(0)
+    return _sais(ints, k)[1:]
+
+# Prefix doubling with NumPy: each round sorts the suffixes by (rank of the first 2**h
+# tokens, rank of the next 2**h tokens) with lexsort, until every rank is distinct.
+# Returns the suffix array and the rank array of every round
+# (levels[h][i] == levels[h][j] iff s[i:] and s[j:] share their first 2**h tokens).
+def prefix_doubling_numpy(s):
+    if np is None:
+        raise ImportError('the numpy suffix array engine requires numpy')
+    n = len(s)
+    if isinstance(s, array):
+        _, rank = np.unique(np.frombuffer(s, dtype=np.dtype(s.typecode)), return_inverse=True)
+    else:
+        rank = np.asarray(int_alphabet(s)[0])
+    rank = rank.astype(np.int32)
+    levels = [rank]
+    sa = np.argsort(rank, kind='stable')
+    width = 1
+    while True:
+        r = rank[sa]
+        if n < 2 or (r[1:] != r[:-1]).all():
+            return sa, levels
+        second = np.full(n, -1, dtype=np.int32)
+        second[:n - width] = rank[width:]
+        sa = np.lexsort((second, rank))
+        r, r2 = rank[sa], second[sa]
+        new = np.empty(n, dtype=np.int32)
+        new[0] = 0
+        new[1:] = np.cumsum((r[1:] != r[:-1]) | (r2[1:] != r2[:-1]))
+        rank = np.empty(n, dtype=np.int32)
+        rank[sa] = new
+        levels.append(rank)
+        width *= 2
+
+def suffix_array_numpy(s):
+    if not len(s):
+        return []
+    return prefix_doubling_numpy(s)[0].tolist()
+
+SUFFIX_ARRAY_ENGINES = {
+    'naive': suffix_array_naive,
+    'sais': suffix_array_sais,
+    'numpy': suffix_array_numpy,
+}
+
+# build the suffix array of s with the named engine
+def suffix_array(s, engine='sais'):
+    if engine not in SUFFIX_ARRAY_ENGINES:
+        raise ValueError('unknown suffix array engine: {}'.format(engine))
+    return SUFFIX_ARRAY_ENGINES[engine](s)
+
 # find all longest common prefixes in string s
 def lcp_array(s, sa):
     # Kasai et al's algorithm:
@@ -26,6 +203,38 @@ def lcp_array(s, sa):
             k -= 1
     return lcp
 
+# lcp array (same layout as lcp_array) from the prefix doubling ranks:
+# all adjacent suffix pairs are extended at once by binary lifting over the levels,
+# largest power of two first.
+def lcp_array_numpy(s, sa, levels):
+    n = len(s)
+    lcp = np.zeros(n, dtype=np.int64)
+    if n < 2:
+        return lcp.tolist()
+    sa = np.asarray(sa)
+    a, b = sa[:-1], sa[1:]
+    ext = np.zeros(n - 1, dtype=np.int64)
+    for h in range(len(levels) - 1, -1, -1):
+        rank = levels[h]
+        ia, ib = a + ext, b + ext
+        ok = (ia < n) & (ib < n)
+        eq = np.zeros(n - 1, dtype=bool)
+        eq[ok] = rank[ia[ok]] == rank[ib[ok]]
+        ext += eq.astype(np.int64) << h
+    lcp[:-1] = ext
+    return lcp.tolist()
+
+# suffix array and lcp array of s, built with the named suffix array engine
+# (the numpy engine computes the lcp array from its own doubling ranks)
+def suffix_and_lcp_arrays(s, engine='sais'):
+    if engine == 'numpy':
+        if not len(s):
+            return [], []
+        sa, levels = prefix_doubling_numpy(s)
+        return sa.tolist(), lcp_array_numpy(s, sa, levels)
+    sa = suffix_array(s, engine)
+    return sa, lcp_array(s, sa)
+
 def print_suffix_info(s, sa, lcp):
     print(f'\n{s}\n')
     for index, i in enumerate(sa):
@@ -71,3 +280,240 @@ def tandem_repeats(s, sa, lcp):
                     continue
                 tandem_repeats[repeat] = (sa[j] + repeat_start, repeats)
     return tandem_repeats
+
+# inverse of a suffix array: rank[i] is the position of suffix i in sa
+def suffix_ranks(sa):
+    rank = [0] * len(sa)
+    for r, i in enumerate(sa):
+        rank[i] = r
+    return rank
+
+# Range-minimum table over an lcp array: level k holds the minimum of a[i:i + 2**k].
+def sparse_table(a):
+    table = [list(a)]
+    width = 1
+    while 2 * width <= len(a):
+        prev = table[-1]
+        table.append(list(map(min, prev[:-width], prev[width:])))
+        width *= 2
+    return table
+
+# Longest common extension queries on s: lce(i, j) is the length of the
+# longest common prefix of s[i:] and s[j:], answered in O(1) with an RMQ over the lcp array.
+def lce_query(s, engine='sais'):
+    n = len(s)
+    sa, lcp = suffix_and_lcp_arrays(s, engine)
+    rank = suffix_ranks(sa)
+    table = sparse_table(lcp)
+
+    def lce(i, j):
+        if i == j:
+            return n - i
+        lo, hi = rank[i], rank[j]
+        if lo > hi:
+            lo, hi = hi, lo
+        k = (hi - lo).bit_length() - 1
+        row = table[k]
+        a, b = row[lo], row[hi - (1 << k)]
+        return a if a < b else b
+    return lce, rank
+
+# Longest Lyndon word starting at each position, as its (exclusive) end index.
+# With suffix ranks this is the next position whose suffix is smaller.
+def lyndon_array(rank):
+    n = len(rank)
+    ends = [n] * n
+    stack = []
+    for i in range(n - 1, -1, -1):
+        while stack and rank[stack[-1]] > rank[i]:
+            stack.pop()
+        ends[i] = stack[-1] if stack else n
+        stack.append(i)
+    return ends
+
+# All runs (maximal periodicities) of s, as a sorted list of (start, end, period)
+# with end - start >= 2 * period and period minimal.
+# Follows the Lyndon root construction of the runs theorem (Bannai et al.):
+# every run has a Lyndon root that is the longest Lyndon word at its position
+# under one of the two alphabet orders, so extending each such word with LCE queries
+# in both directions finds every run in O(n) queries.
+def runs(s, engine='sais'):
+    n = len(s)
+    if n < 2:
+        return []
+    # int arrays keep their numeric order in int_alphabet(), so the second order is the exact reverse
+    ints, k = int_alphabet(s)
+    ints = array('i', ints)
+    lce, rank = lce_query(ints, engine)
+    lce_rev, _ = lce_query(ints[::-1], engine)
+    rank_inv = suffix_ranks(suffix_array(array('i', [k - c for c in ints]), engine))
+
+    found = set()
+    for ranks in (rank, rank_inv):
+        for i, j in enumerate(lyndon_array(ranks)):
+            p = j - i
+            fwd = lce(i, j) if j < n else 0
+            back = lce_rev(n - i, n - j) if i > 0 else 0
+            if fwd + back >= p:
+                found.add((i - back, j + fwd, p))
+    return sorted(found)
+
+# The runs of s with period at most max_period, as runs() returns them, computed over windows
+# of window tokens so that the suffix structures never cover more than one window.
+# Neighbouring windows overlap by 2 * max_period tokens, so a run that crosses a border is found
+# in both windows with pieces that overlap by at least its period. Two distinct runs of one
+# period overlap by less than the period, so pieces that overlap by at least that much are
+# stitched back into one run.
+def runs_windowed(s, window, max_period, engine='sais'):
+    n = len(s)
+    overlap = 2 * max_period
+    window = max(window, 2 * overlap)
+    pieces = defaultdict(list)
+    start = 0
+    while True:
+        end = min(start + window, n)
+        for a, b, p in runs(s[start:end], engine):
+            if p <= max_period:
+                pieces[p].append((start + a, start + b))
+        if end == n:
+            break
+        start = end - overlap
+    found = []
+    for p, spans in pieces.items():
+        spans.sort()
+        a, b = spans[0]
+        for a2, b2 in spans[1:]:
+            if b - a2 >= p:
+                b = max(b, b2)
+            else:
+                found.append((a, b, p))
+                a, b = a2, b2
+        found.append((a, b, p))
+    return sorted(found)
+
+# The runs of s with period at most max_period, as runs() returns them, without a suffix array.
+# For each period p, s[i:i + p] == s[i + p:i + 2p] exactly when s[j] == s[j + p] for every j
+# in [i, i + p), so comparing the two windows as they roll along s is a match flag per position,
+# and a run of period p is a stretch of at least p matches. Flags are compared token by token
+# (no hashing, so every run is exact), one period at a time: O(n * max_period) time, O(n) memory.
+# An interval already found with a smaller period is not a run of a multiple of that period.
+# With NumPy, the flags of a period and the bounds of their stretches are computed as arrays
+# (see runs_bounded_numpy()).
+def runs_bounded(s, max_period):
+    if np is not None:
+        return runs_bounded_numpy(s, max_period)
+    n = len(s)
+    found = {}
+    for p in range(1, min(max_period, n // 2) + 1):
+        matches = bytes(x == y for x, y in zip(s, s[p:]))
+        for m in re.finditer(b'\x01{%d,}' % p, matches):
+            found.setdefault((m.start(), m.end() + p), p)
+    return sorted((a, b, p) for (a, b), p in found.items())
+
+# runs_bounded() with NumPy: the match flags of a period are one vectorized comparison, and
+# the stretches of matches start and end where the flags (padded with a 0 on both ends) change.
+# Only the stretches of at least p matches, the runs, are visited in Python.
+def runs_bounded_numpy(s, max_period):
+    n = len(s)
+    if isinstance(s, array):
+        v = np.frombuffer(s, dtype=np.dtype(s.typecode))
+    else:
+        v = np.asarray(int_alphabet(s)[0])
+    flags = np.zeros(n + 1, dtype=np.int8)
+    found = {}
+    for p in range(1, min(max_period, n // 2) + 1):
+        flags[1:n - p + 1] = v[:-p] == v[p:]
+        flags[n - p + 1] = 0
+        edges = np.flatnonzero(np.diff(flags[:n - p + 2]))
+        starts, ends = edges[0::2], edges[1::2]
+        runs_of_p = ends - starts >= p
+        for i, j in zip(starts[runs_of_p].tolist(), ends[runs_of_p].tolist()):
+            found.setdefault((i, j + p), p)
+    return sorted((a, b, p) for (a, b), p in found.items())
+
+# Runs of s that contain position q, found by extending q against every other
+# occurrence of s[q] (a run of period p through q has s[q] == s[q - p] or s[q] == s[q + p]).
+# With max_period, only the runs of at most max_period tokens, so only the occurrences
+# within max_period of q are tried.
+def runs_through(s, q, max_period=None):
+    n = len(s)
+    token = s[q]
+    found = {}
+    lo, hi = (0, n) if max_period is None else (max(0, q - max_period), min(n, q + max_period + 1))
+    for o in range(lo, hi):
+        if o == q or s[o] != token:
+            continue
+        i, j = min(o, q), max(o, q)
+        p = j - i
+        back = 0
+        while i - back > 0 and s[i - back - 1] == s[j - back - 1]:
+            back += 1
+        fwd = 0
+        while j + fwd < n and s[i + fwd] == s[j + fwd]:
+            fwd += 1
+        if fwd + back >= p:
+            interval = (i - back, j + fwd)
+            # the same interval found with a multiple of the period is not a run of that period
+            if interval not in found or found[interval] > p:
+                found[interval] = p
+    return {(a, b, p) for (a, b), p in found.items()}
+
+# Update the runs of a stream after old[start:end] was replaced by the single token s[start]
+# (s is the stream after the splice, old_runs are the runs before it).
+# Runs that do not touch the spliced region are only shifted; runs that overlap it are
+# clipped to the unchanged parts, and runs through the new token are found with runs_through().
+def splice_runs(s, old_runs, start, end):
+    return splice_runs_changes(s, old_runs, start, end)[0]
+
+# Same as splice_runs, but also returns what changed: (runs, removed, added), where removed
+# are the old runs (in old positions) that are gone and added the new runs (in new positions)
+# that were not there before. Every other run was only shifted.
+# With max_period (old_runs being the runs of at most max_period tokens), no longer runs are added.
+def splice_runs_changes(s, old_runs, start, end, max_period=None):
+    shift = end - start - 1
+    crossing = runs_through(s, start, max_period)
+    kept = {} # new run -> the old run it was shifted from, None for clipped parts
+    removed = []
+    for run in old_runs:
+        a, b, p = run
+        if b <= start:
+            kept[run] = run
+        elif a >= end:
+            kept[(a - shift, b - shift, p)] = run
+        else:
+            removed.append(run)
+            for a, b in [(a, start), (end - shift, b - shift)]:
+                if b - a >= 2 * p:
+                    kept[(a, b, p)] = None
+    # a run that ends right before (or starts right after) the new token
+    # and now extends through it is part of a crossing run
+    for run in [r for r in kept if r[1] == start or r[0] == start + 1]:
+        a, b, p = run
+        if any(p == cp and ca <= a and b <= cb for ca, cb, cp in crossing):
+            old = kept.pop(run)
+            if old:
+                removed.append(old)
+    added = [run for run, old in kept.items() if old is None] + sorted(crossing)
+    return sorted(set(kept) | crossing), removed, added
+
+# given: the runs of a token stream,
+# return: one tandem repeat per run, as (start, period, repeats): the rotation of the run's period
+# that repeats the most times, the latest one on ties. Only the bounds of the run are needed,
+# so each is O(1); the repeated tokens, s[start:start + period], are left to the caller.
+def tandem_repeats_from_runs(runs):
+    return [(a + (b - a) % p, p, (b - a) // p) for a, b, p in runs]
+
+# given: a token stream (s),
+# return: the tandem repeats of its runs (see tandem_repeats_from_runs).
+def tandem_repeats_runs(s, engine='sais'):
+    return tandem_repeats_from_runs(runs(s, engine))
+
+# given: a token stream (s) and a period bound,
+# return: the tandem repeats of its runs of at most max_period tokens, found with runs_bounded().
+def tandem_repeats_bounded(s, max_period):
+    return tandem_repeats_from_runs(runs_bounded(s, max_period))
+
+# given: a token stream (s), a window size and a period bound,
+# return: the tandem repeats of its runs of at most max_period tokens, found with runs_windowed().
+def tandem_repeats_windowed(s, window, max_period, engine='sais'):
+    return tandem_repeats_from_runs(runs_windowed(s, window, max_period, engine))
@@ -0,0 +1,203 @@
+import argparse
+import random
+import sys
+import pyrtl
+
+# Synthetic netlists with known loop structure, for stress-testing loop identification
+# at sizes well beyond the bundled BLIFs.
+#
+# The design is reps repetitions of a body of `body` single-bit gates:
+#   t_0 = a[r] ^ b[r];  t_j = t_{j-1} (&,|,^) (a[r] or b[r]);  o[r] = t_{body-1}
+# nest adds outer levels: nest=(m,) repeats the reps inner repetitions m times, each followed
+# by a tail gate folding that group's outputs into u[.]; nest=(m1, m2) nests once more, etc.
+# noise is the probability of an unrelated gate (on the c input, to the x output) after each
+# repetition; memories adds that many memories read at address r in every body (PyRTL only);
+# registered puts every o[r] behind a register.
+#
+# synth_gates() streams the netlist as records, which are either built into the PyRTL working
+# block (build_pyrtl()) or written as a BLIF file (write_blif()) without materializing the
+# netlist, so millions of nets stay cheap to generate:
+#   ('input'|'output', name, width), ('gate', op, y, a, b), ('latch', d, q), ('mem', name, data width, addr width),
+#   ('mem_read', mem, addr, y)
+# Signals are single bits, named name[i] for port bits.
+
+MEM_ADDR_WIDTH = 4
+
+def nest_sizes(reps, nest):
+    sizes = [reps]
+    for m in nest:
+        sizes.append(sizes[-1] * m)
+    return sizes
+
+def synth_gates(reps=8, body=4, nest=(), noise=0.0, memories=0, registered=False, seed=0):
+    if reps < 1 or body < 1:
+        raise ValueError('reps and body must be positive')
+    rng = random.Random(seed)
+    sizes = nest_sizes(reps, nest)
+    total = sizes[-1]
+    tails = sum(total // s for s in sizes[1:])
+    noise_gates = [r for r in range(total) if noise and rng.random() < noise]
+
+    yield ('input', 'a', total)
+    yield ('input', 'b', total)
+    if noise_gates:
+        yield ('input', 'c', 2)
+    yield ('output', 'o', total)
+    if tails:
+        yield ('output', 'u', tails)
+    if noise_gates:
+        yield ('output', 'x', len(noise_gates))
+    for m in range(memories):
+        yield ('mem', 'mem{}'.format(m), 1, MEM_ADDR_WIDTH)
+
+    ops = ['&', '|', '^']
+    noise_at = set(noise_gates)
+    noise_out = 0
+    tail_out = 0
+    for r in range(total):
+        a, b = 'a[{}]'.format(r), 'b[{}]'.format(r)
+        t = 'r{}_0'.format(r)
+        yield ('gate', '^', t, a, b)
+        for m in range(memories):
+            d = 'r{}_m{}'.format(r, m)
+            yield ('mem_read', 'mem{}'.format(m), r % (1 << MEM_ADDR_WIDTH), d)
+            yield ('gate', '^', t + 'm' + str(m), t, d)
+            t = t + 'm' + str(m)
+        for j in range(1, body):
+            y = 'o[{}]'.format(r) if j == body - 1 and not registered else 'r{}_{}'.format(r, j)
+            yield ('gate', ops[j % 3], y, t, a if j % 2 else b)
+            t = y
+        if body == 1 and not registered:
+            yield ('gate', '&', 'o[{}]'.format(r), t, t)
+        elif registered:
+            yield ('latch', t, 'o[{}]'.format(r))
+
+        if r in noise_at:
+            yield ('gate', rng.choice(ops), 'x[{}]'.format(noise_out), 'c[0]', 'c[1]')
+            noise_out += 1
+
+        # close every nesting level that ends with this repetition
+        for level, size in enumerate(sizes[1:]):
+            if (r + 1) % size:
+                break
+            inner = sizes[level]
+            first = r + 1 - size
+            acc = 'o[{}]'.format(first)
+            for i in range(first + inner, r + 1, inner):
+                y = 'g{}_{}_{}'.format(level, r, i)
+                yield ('gate', '^', y, acc, 'o[{}]'.format(i))
+                acc = y
+            yield ('gate', '|', 'u[{}]'.format(tail_out), acc, acc)
+            tail_out += 1
+
+# Builds the synthetic netlist in the PyRTL working block.
+def build_pyrtl(**spec):
+    wires = {}
+    ports = {}
+    mems = {}
+    outputs = {}
+
+    def get(name):
+        if name not in wires:
+            port, bit = name[:-1].split('[')
+            wires[name] = ports[port][int(bit)]
+        return wires[name]
+
+    def put(name, value):
+        if '[' in name and name.split('[')[0] in outputs:
+            port, bit = name[:-1].split('[')
+            outputs[port][int(bit)] = value
+        wires[name] = value
+
+    for g in synth_gates(**spec):
+        kind = g[0]
+        if kind == 'input':
+            ports[g[1]] = pyrtl.Input(g[2], g[1])
+        elif kind == 'output':
+            ports[g[1]] = pyrtl.Output(g[2], g[1])
+            outputs[g[1]] = [None] * g[2]
+        elif kind == 'mem':
+            mems[g[1]] = pyrtl.MemBlock(bitwidth=g[2], addrwidth=g[3], name=g[1], max_read_ports=None)
+            mems[g[1]][pyrtl.Const(0, g[3])] <<= get('a[0]')
+        elif kind == 'mem_read':
+            put(g[3], mems[g[1]][pyrtl.Const(g[2], MEM_ADDR_WIDTH)])
+        elif kind == 'gate':
+            a, b = get(g[3]), get(g[4])
+            put(g[2], a & b if g[1] == '&' else a | b if g[1] == '|' else a ^ b)
+        elif kind == 'latch':
+            reg = pyrtl.Register(1, name='reg_' + g[2].replace('[', '_').replace(']', ''))
+            reg.next <<= get(g[1])
+            put(g[2], reg)
+    for name, bits in outputs.items():
+        ports[name] <<= pyrtl.concat_list(bits)
+    return pyrtl.working_block()
+
+BLIF_TABLES = {'&': ['11 1'], '|': ['1- 1', '-1 1'], '^': ['10 1', '01 1']}
+
+# Writes a port list on one line: pyrtl.input_from_blif reads a '\' continuation as a signal name.
+def write_names(f, keyword, names):
+    f.write(' '.join([keyword] + names) + '\n')
+
+# Port bit names: a 1-bit port is written without an index, as Yosys does
+# (pyrtl.input_from_blif connects 'u' but not 'u[0]' to a 1-bit port u).
+def port_names(name, width, bare):
+    if width == 1:
+        bare[name + '[0]'] = name
+        return [name]
+    return ['{}[{}]'.format(name, i) for i in range(width)]
+
+# Writes the synthetic netlist as a BLIF model (single-bit .names gates and .latch registers).
+def write_blif(f, model='synth', clock='clk', **spec):
+    gates = synth_gates(**spec)
+    inputs, outputs = [], []
+    bare = {}
+    first = None
+    for g in gates:
+        if g[0] == 'input':
+            inputs += port_names(g[1], g[2], bare)
+        elif g[0] == 'output':
+            outputs += port_names(g[1], g[2], bare)
+        elif g[0] == 'mem':
+            raise ValueError('memories are not supported in BLIF output')
+        else:
+            first = g
+            break
+    f.write('.model {}\n'.format(model))
+    write_names(f, '.inputs', inputs + ([clock] if spec.get('registered') else []))
+    write_names(f, '.outputs', outputs)
+
+    def emit(g):
+        if g[0] == 'gate':
+            f.write('.names {} {} {}\n'.format(bare.get(g[3], g[3]), bare.get(g[4], g[4]), bare.get(g[2], g[2])))
+            f.write('\n'.join(BLIF_TABLES[g[1]]) + '\n')
+        elif g[0] == 'latch':
+            f.write('.latch {} {} re {} 0\n'.format(bare.get(g[1], g[1]), bare.get(g[2], g[2]), clock))
+        else:
+            raise ValueError('memories are not supported in BLIF output')
+
+    if first is not None:
+        emit(first)
+    for g in gates:
+        emit(g)
+    f.write('.end\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic BLIF with known loop structure.')
+    parser.add_argument('output', help="BLIF file to write ('-' for stdout)")
+    parser.add_argument('--reps', type=int, default=64, help='repetitions of the body')
+    parser.add_argument('--body', type=int, default=4, help='gates per body')
+    parser.add_argument('--nest', type=int, nargs='*', default=[],
+                        help='outer repetition counts, innermost first')
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help='probability of a noise gate after each repetition')
+    parser.add_argument('--registered', action='store_true', help='register every body output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    spec = dict(reps=args.reps, body=args.body, nest=tuple(args.nest), noise=args.noise,
+                registered=args.registered, seed=args.seed)
+    if args.output == '-':
+        write_blif(sys.stdout, **spec)
+    else:
+        with open(args.output, 'w') as f:
+            write_blif(f, **spec)
@@ -0,0 +1,48 @@
+import io
+import random
+from blifFrontend import blif_to_defs, simulate_defs
+from netlistCleanup import cleanup_defs
+
+def bus(name, width):
+    return ['{}[{}]'.format(name, i) for i in range(width)]
+
+def ports(formal, name, width):
+    return ' '.join('{}[{}]={}'.format(formal, i, s) for i, s in enumerate(bus(name, width)))
+
+# Covers, latches and Yosys cells ($add, $mux, $shl), written the way Yosys writes them;
+# only the streaming front end reads it, so PyRTL does not need to know the cells.
+CELLS_BLIF = '\n'.join([
+    '.model cells',
+    '.inputs ' + ' '.join(bus('a', 4) + bus('b', 4) + ['s'] + bus('sh', 2) + ['clk']),
+    '.outputs ' + ' '.join(bus('sum', 4) + bus('m', 4) + bus('y', 4) + bus('q', 4) + ['c', 'e']),
+    '.subckt $add {} {} {}'.format(ports('A', 'a', 4), ports('B', 'b', 4), ports('Y', 'sum', 4)),
+    '.subckt $mux {} {} S=s {}'.format(ports('A', 'a', 4), ports('B', 'b', 4), ports('Y', 'm', 4)),
+    '.subckt $shl {} {} {}'.format(ports('A', 'a', 4), ports('B', 'sh', 2), ports('Y', 'y', 4)),
+] + ['.latch sum[{0}] q[{0}] re clk 0'.format(i) for i in range(4)] + [
+    # s ? b[0] : a[0] as a sum of products
+    '.names a[0] b[0] s c', '1-0 1', '-11 1',
+    # a buffer and an inverted cover
+    '.names c cb', '1 1',
+    '.names cb a[3] e', '0- 1', '-0 1',
+    '.end', ''])
+
+def expected_outputs(stimulus):
+    outputs = []
+    q = 0
+    for x in stimulus:
+        a, b, s, sh = x['a'], x['b'], x['s'], x['sh']
+        total = (a + b) & 15
+        c = (b if s else a) & 1
+        outputs.append({'sum': total, 'm': b if s else a, 'y': (a << sh) & 15, 'q': q,
+                        'c': c, 'e': int(not (c and a >> 3))})
+        q = total
+    return outputs
+
+def test_simulate_cells_after_cleanup():
+    defs = blif_to_defs(io.StringIO(CELLS_BLIF))
+    rng = random.Random(3)
+    stimulus = [{'a': rng.getrandbits(4), 'b': rng.getrandbits(4), 's': rng.getrandbits(1),
+                 'sh': rng.getrandbits(2), 'clk': 0} for _ in range(64)]
+    expected = expected_outputs(stimulus)
+    assert simulate_defs(defs, stimulus) == expected
+    assert simulate_defs(cleanup_defs(defs)[0], stimulus) == expected
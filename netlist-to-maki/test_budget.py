@@ -0,0 +1,81 @@
+import os
+import pyrtl
+from budget import Deadline
+from instrument import Trace
+from main import run_benchmark
+from netlistCache import NetlistCache
+from netlistToMaki import netlist_to_ast, convert_to_debruijn, ir_to_racket, find_loops, topoSortDefs
+from test_netlistToMaki import BENCHMARKS, bench_defs, synth_defs, def_pairs, names
+
+# A Deadline that expires at its (n + 1)th check.
+class ExpiresAfter(Deadline):
+    def __init__(self, n):
+        Deadline.__init__(self, 0)
+        self.checks = n
+
+    def expired(self, where='unknown'):
+        self.checks -= 1
+        return self.checks < 0 and Deadline.expired(self, where)
+
+def test_never_expires():
+    deadline = Deadline()
+    assert not deadline.expired('find_loops') and deadline.remaining() is None
+    assert deadline.exhausted is None
+
+def test_expired_names_first_phase():
+    deadline = Deadline(0)
+    assert deadline.remaining() == 0.0
+    assert deadline.expired('topoSortDefs') and deadline.expired('find_loops')
+    assert deadline.exhausted == 'topoSortDefs'
+
+def test_find_loops_returns_loops_so_far():
+    defs = synth_defs(reps=20, body=3, nest=(4,))
+    ast = netlist_to_ast(defs)
+    convert_to_debruijn(ast)
+    deadline = Deadline(0)
+    assert find_loops(ast, ir_to_racket(ast, 'test'), deadline=deadline) == []
+    assert deadline.exhausted == 'find_loops'
+
+    ast = netlist_to_ast(defs)
+    convert_to_debruijn(ast)
+    loops = find_loops(ast, ir_to_racket(ast, 'test'))
+    assert len(loops) > 2
+    ast = netlist_to_ast(defs)
+    convert_to_debruijn(ast)
+    deadline = ExpiresAfter(2)
+    partial = find_loops(ast, ir_to_racket(ast, 'test'), deadline=deadline)
+    assert len(partial) == 2 and all(l in loops for l in partial)
+    assert deadline.exhausted == 'find_loops'
+
+def test_topo_sort_appends_remaining_defs():
+    # listed users first, so the sorted order is the reverse of the given one
+    pairs = def_pairs([[1], [2], [3], []])
+    assert names(topoSortDefs(pairs)) == ['tmp3', 'tmp2', 'tmp1', 'tmp0']
+    deadline = Deadline(0)
+    assert topoSortDefs(pairs, deadline) == pairs
+    assert deadline.exhausted == 'topoSortDefs'
+
+# out of budget, the constants and selects are left as they are instead of folded into their uses
+def test_netlist_to_ast_skips_folding():
+    defs = bench_defs(BENCHMARKS[0])
+    deadline = Deadline(0)
+    partial = netlist_to_ast(defs, deadline=deadline)
+    assert deadline.exhausted == 'topoSortDefs'
+    assert len(partial.cmds) > len(netlist_to_ast(defs).cmds)
+
+def test_exhausted_run_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('results')
+    os.mkdir('results_rerolled')
+    cache = NetlistCache(str(tmp_path / 'cache'))
+    pyrtl.reset_working_block()
+    trace = Trace()
+    run_benchmark(BENCHMARKS[0], 'clk', '-pyrtl', trace, cache, deadline=Deadline(0), frontend='stream')
+    assert trace.info['budget_exhausted'] == 'topoSortDefs'
+    assert trace.info['cache'] == 'miss'
+    assert os.listdir(cache.directory) == []
+
+    trace = Trace()
+    run_benchmark(BENCHMARKS[0], 'clk', '-pyrtl', trace, cache, deadline=Deadline(60), frontend='stream')
+    assert 'budget_exhausted' not in trace.info
+    assert len(os.listdir(cache.directory)) == 1
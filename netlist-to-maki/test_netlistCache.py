@@ -0,0 +1,77 @@
+import os
+import shutil
+import netlistCache
+from netlistCache import NetlistCache, CONVERTER_SOURCES, converter_version
+from test_netlistToMaki import BENCHMARKS, bench_defs
+from main import block_to_ast
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def test_round_trip(tmp_path):
+    cache = NetlistCache(str(tmp_path))
+    ast = block_to_ast(defs=bench_defs(BENCHMARKS[0]))
+    key = cache.key(b'.model m\n', 'clk')
+    assert cache.load(key) is None
+    cache.store(key, ast)
+    assert str(cache.load(key)) == str(ast)
+
+def test_truncated_entry(tmp_path):
+    cache = NetlistCache(str(tmp_path))
+    key = cache.key(b'.model m\n', 'clk')
+    cache.store(key, block_to_ast(defs=bench_defs(BENCHMARKS[0])))
+    with open(cache.path(key), 'r+b') as f:
+        f.truncate(10)
+    assert cache.load(key) is None
+    assert not os.path.exists(cache.path(key))
+
+def test_key(tmp_path):
+    key = NetlistCache(str(tmp_path)).key
+    keys = {key(b'.model m\n', 'clk'), key(b'.model n\n', 'clk'), key(b'.model m\n', 'clock'),
+            key(b'.model m\n', 'clk', 'stream'), key(b'.model m\n', 'clk', intern=True),
+            key(b'.model m\n', 'clk', cleanup='pyrtl')}
+    assert len(keys) == 6
+    assert key('.model m\n', 'clk') == key(b'.model m\n', 'clk')
+
+# interned and plain ASTs are cached apart, so a run gets the AST it asked for
+def test_intern_round_trip(tmp_path):
+    cache = NetlistCache(str(tmp_path))
+    ast = block_to_ast(defs=bench_defs(BENCHMARKS[0]), intern=True)
+    cache.store(cache.key(b'.model m\n', 'clk', intern=True), ast)
+    assert cache.load(cache.key(b'.model m\n', 'clk')) is None
+    assert str(cache.load(cache.key(b'.model m\n', 'clk', intern=True))) == str(ast)
+
+def test_converter_version_covers_sources(tmp_path):
+    assert 'netlistCleanup.py' in CONVERTER_SOURCES
+    for source in CONVERTER_SOURCES:
+        shutil.copy(os.path.join(HERE, source), str(tmp_path))
+    version = converter_version(str(tmp_path))
+    assert version == netlistCache.CONVERTER_VERSION
+    for source in CONVERTER_SOURCES:
+        with open(os.path.join(str(tmp_path), source), 'a') as f:
+            f.write('\n')
+        assert converter_version(str(tmp_path)) != version
+        version = converter_version(str(tmp_path))
+
+def test_converter_version_covers_pyrtl(monkeypatch):
+    version = converter_version()
+    monkeypatch.setattr(netlistCache.importlib.metadata, 'version', lambda name: '0.0.0-' + name)
+    assert netlistCache.pyrtl_version() == '0.0.0-pyrtl'
+    assert converter_version() != version
+
+# another run may evict an entry between reading it and refreshing its mtime
+def test_load_evicted_entry(tmp_path, monkeypatch):
+    cache = NetlistCache(str(tmp_path))
+    key = cache.key(b'.model m\n', 'clk')
+    ast = block_to_ast(defs=bench_defs(BENCHMARKS[0]))
+    cache.store(key, ast)
+    def evicted(path):
+        os.remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(netlistCache.os, 'utime', evicted)
+    assert str(cache.load(key)) == str(ast)
+    assert cache.load(key) is None
+
+def test_eviction(tmp_path):
+    cache = NetlistCache(str(tmp_path), max_bytes=0)
+    cache.store(cache.key(b'a', 'clk'), block_to_ast(defs=bench_defs(BENCHMARKS[0])))
+    assert os.listdir(str(tmp_path)) == []
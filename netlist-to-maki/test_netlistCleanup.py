@@ -0,0 +1,78 @@
+import os
+import random
+import pyrtl
+import pytest
+from blifFrontend import read_blif_defs, simulate_defs
+from instrument import Trace
+from main import block_defs, clean_netlist, run_benchmark
+from netlistCleanup import cleanup_defs
+from synthNetlist import build_pyrtl, write_blif
+from test_netlistToMaki import BENCHMARKS
+
+def random_stimulus(defs, cycles=16, seed=0):
+    rng = random.Random(seed)
+    ports = sorted((w.name, w.bitwidth) for w in defs if w._code == 'I')
+    return [{name: rng.getrandbits(width) for name, width in ports} for _ in range(cycles)]
+
+# cleanup_defs() keeps the outputs of every cycle; returns its counts
+def assert_cleanup_equivalent(defs):
+    stimulus = random_stimulus(defs)
+    cleaned, counts = cleanup_defs(defs)
+    assert simulate_defs(cleaned, stimulus) == simulate_defs(defs, stimulus)
+    return counts
+
+def test_cleanup_equivalent_on_benchmarks():
+    for bench in BENCHMARKS:
+        assert_cleanup_equivalent(read_blif_defs(bench))
+
+# every kind of rewrite: an unused net, constant arithmetic, a mux with a constant select,
+# selects of concats and concats of selects
+def test_cleanup_rewrites():
+    pyrtl.reset_working_block()
+    a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+    o, p = pyrtl.Output(8, 'o'), pyrtl.Output(4, 'p')
+    unused = a ^ b
+    k = pyrtl.Const(3, 8) + pyrtl.Const(4, 8)
+    c = pyrtl.concat(a[4:], b[:4])
+    m = pyrtl.select(pyrtl.Const(1, 1), a, k[:8])
+    r = pyrtl.Register(8, 'r')
+    r.next <<= c[2:6].zero_extended(8) | m
+    o <<= r & pyrtl.concat(c[4:], c[:4])
+    p <<= c[1:5]
+    counts = assert_cleanup_equivalent(block_defs())
+    assert counts['removed_nets'] and counts['folded_constants'] and counts['combined_slices']
+
+@pytest.mark.parametrize('spec', [dict(reps=8, body=4, nest=(2,), noise=0.2, registered=True),
+                                  dict(reps=12, body=3, noise=0.5, seed=3)])
+def test_cleanup_equivalent_on_pyrtl(spec):
+    pyrtl.reset_working_block()
+    build_pyrtl(**spec)
+    assert_cleanup_equivalent(block_defs())
+
+# the PyRTL cleanup (--cleanup pyrtl) only drops wires nothing drives or reads
+def test_clean_netlist_equivalent():
+    pyrtl.reset_working_block()
+    build_pyrtl(reps=8, body=4, noise=0.2, registered=True)
+    pyrtl.WireVector(4, 'dangling')
+    defs = block_defs()
+    stimulus = random_stimulus(defs)
+    assert clean_netlist() == 1
+    assert 'dangling' not in pyrtl.working_block().wirevector_by_name
+    assert simulate_defs(block_defs(), stimulus) == simulate_defs(defs, stimulus)
+
+def test_run_benchmark_cleanup_pyrtl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('results')
+    os.mkdir('results_rerolled')
+    with open('synth.blif', 'w') as f:
+        write_blif(f, reps=16, body=3, registered=True)
+    loops = {}
+    for cleanup in ('defs', 'pyrtl'):
+        pyrtl.reset_working_block()
+        trace = Trace()
+        run_benchmark('synth.blif', 'clk', '-pyrtl', trace, cleanup=cleanup)
+        loops[cleanup] = trace.counts['loops_found']
+        assert ('cleanup_removed_wires' in trace.counts) == (cleanup == 'pyrtl')
+    assert loops['defs'] > 0 and loops['pyrtl'] > 0
+    with pytest.raises(ValueError):
+        run_benchmark('synth.blif', 'clk', '-pyrtl', frontend='stream', cleanup='pyrtl')
@@ -0,0 +1,209 @@
+import glob
+import io
+import os
+import pytest
+import pyrtl
+import random
+from blifFrontend import BlifWire, blif_to_defs, read_blif_defs
+from netlistCleanup import cleanup_defs
+import netlistToMaki
+from netlistToMaki import netlist_to_ast, convert_to_debruijn, ir_to_racket, find_loops, topoSortDefs, \
+    collapse_loop, ForCmd, write_maki, find_loop_hierarchy, loop_id, ast_to_tokens, ast_to_token_ids, TokenCache, \
+    expression_tokens
+from instrument import Trace
+from rerollLoops import reroll_loops
+from synthNetlist import write_blif
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = sorted(glob.glob(os.path.join(HERE, 'basejump-netlists', '*.blif')))
+
+def synth_defs(**spec):
+    f = io.StringIO()
+    write_blif(f, **spec)
+    f.seek(0)
+    return cleanup_defs(blif_to_defs(f))[0]
+
+def bench_defs(bench):
+    return cleanup_defs(read_blif_defs(bench))[0]
+
+def loops_of(defs, **options):
+    ast = netlist_to_ast(defs)
+    convert_to_debruijn(ast)
+    return find_loops(ast, ir_to_racket(ast, 'test'), **options)
+
+# (wire, net) pairs of tmp<i> definitions, each using the wires named in uses[i]
+def def_pairs(uses):
+    wires = [BlifWire('tmp%d' % i, 1) for i in range(len(uses))]
+    return [(w, pyrtl.LogicNet('&', None, tuple(wires[u] for u in us) + (BlifWire('in', 1, 'I'),), (w,)))
+            for w, us in zip(wires, uses)]
+
+def names(pairs):
+    return [w.name for w, _ in pairs]
+
+def test_topo_sort_defs():
+    rnd = random.Random(7)
+    for _ in range(200):
+        n = rnd.randint(0, 30)
+        order = list(range(n))
+        rnd.shuffle(order)
+        # a dag over the shuffled order, listed in name order
+        uses = [[] for _ in range(n)]
+        for k, i in enumerate(order):
+            uses[i] = rnd.sample(order[:k], min(k, rnd.randint(0, 3)))
+        pairs = def_pairs(uses)
+        result = topoSortDefs(pairs)
+        assert sorted(names(result)) == sorted(names(pairs))
+        position = {w.name: k for k, (w, _) in enumerate(result)}
+        for w, net in result:
+            assert all(position[a.name] < position[w.name] for a in net.args if a._code == 'W')
+        # ties go to the given order: the result is the smallest valid order by given position
+        done = set()
+        for w, net in result:
+            ready = [v.name for v, m in pairs if v.name not in done
+                     and all(a.name in done for a in m.args if a._code == 'W')]
+            assert w.name == ready[0]
+            done.add(w.name)
+        assert topoSortDefs(result) == result
+
+def test_topo_sort_defs_cycle():
+    pairs = def_pairs([[2], [], [0], [1]])
+    assert names(topoSortDefs(pairs)) == ['tmp1', 'tmp3', 'tmp0', 'tmp2']
+
+SYNTH = [dict(reps=40, body=3), dict(reps=60, body=5, noise=0.1, seed=1), dict(reps=30, body=4, noise=0.3, seed=2)]
+
+@pytest.mark.parametrize('spec', SYNTH)
+def test_incremental_matches_full(spec):
+    defs = synth_defs(**spec)
+    assert loops_of(defs, incremental=True) == loops_of(defs, incremental=False)
+
+# with a window, loop bodies are bounded by max_period on both paths
+@pytest.mark.parametrize('max_period', [1, 2, 4])
+def test_windowed_incremental_matches_full(max_period):
+    for bench in BENCHMARKS[::4]:
+        defs = bench_defs(bench)
+        assert loops_of(defs, window=40, max_period=max_period) == \
+            loops_of(defs, window=40, max_period=max_period, incremental=False), bench
+
+# the bounded engine keeps its runs across rounds too, without adding runs longer than max_period
+@pytest.mark.parametrize('max_period', [1, 2, 4, 128])
+def test_bounded_incremental_matches_full(max_period):
+    for bench in BENCHMARKS[::4]:
+        defs = bench_defs(bench)
+        assert loops_of(defs, engine='bounded', max_period=max_period) == \
+            loops_of(defs, engine='bounded', max_period=max_period, incremental=False), bench
+    for spec in SYNTH:
+        defs = synth_defs(nest=(4,), **spec)
+        assert loops_of(defs, engine='bounded', max_period=max_period) == \
+            loops_of(defs, engine='bounded', max_period=max_period, incremental=False)
+
+# loops of loops: collapsing an outer loop names it through the first command of its innermost body
+@pytest.mark.parametrize('nest', [(4,), (4, 4), (3, 2, 2)])
+def test_nested_loops(nest):
+    defs = synth_defs(reps=4, body=3, nest=nest)
+    loops = loops_of(defs)
+    assert loops and max(l[2] for l in loops) >= 4
+    assert loops_of(defs, incremental=False) == loops
+
+def test_incremental_matches_full_on_benchmarks():
+    for bench in BENCHMARKS:
+        defs = bench_defs(bench)
+        assert loops_of(defs, incremental=True) == loops_of(defs, incremental=False), bench
+
+# ForCmd has slots for its index, range and body only: nothing may ask a loop for its lhs
+def test_ir_to_racket_with_loops():
+    ast = netlist_to_ast(synth_defs(reps=20, body=3))
+    convert_to_debruijn(ast)
+    _, ast = collapse_loop(ast, 4, 3, 20)
+    index = str(ast.cmds[4].index)
+    varMap = ir_to_racket(ast, 'test')
+    assert ast.cmds[4].index == varMap[index]
+
+@pytest.mark.parametrize('options', [dict(), dict(incremental=False), dict(engine='naive'), dict(engine='bounded'),
+                                     dict(engine='hierarchy'), dict(window=40, max_period=16)])
+def test_find_loops_counts_tokens(options):
+    defs = synth_defs(reps=20, body=3, noise=0.2)
+    trace = Trace()
+    loops_of(defs, trace=trace, **options)
+    assert trace.counts['tokens'] == len(netlist_to_ast(defs).cmds)
+
+# Counts the ast_to_tokens() calls on commands (not on their subexpressions).
+def count_command_tokenizing(monkeypatch):
+    tokenized = []
+    def counted(ast, *args):
+        if isinstance(ast, (netlistToMaki.DefCmd, netlistToMaki.AssignCmd, ForCmd)):
+            tokenized.append(ast)
+        return ast_to_tokens(ast, *args)
+    monkeypatch.setattr(netlistToMaki, 'ast_to_tokens', counted)
+    return tokenized
+
+# a command rewritten in place keeps its old token until it is invalidated
+def test_token_cache_invalidate():
+    ast = netlist_to_ast(synth_defs(reps=20, body=3, noise=0.2))
+    convert_to_debruijn(ast)
+    cache = TokenCache()
+    tok, table = ast_to_token_ids(ast, cache=cache)
+    c = ast.cmds[-1]
+    other = next(d for d in ast.cmds if ast_to_tokens(d.rhs) != ast_to_tokens(c.rhs))
+    c.rhs = other.rhs
+    assert cache.token_id(c) == tok[-1]
+    cache.invalidate(c)
+    assert table.decode(cache.token_id(c)) == ast_to_tokens(c)
+    assert table.decode(cache.token_id(c)) != table.decode(tok[-1])
+
+# across loop_id rounds, only the ForCmd collapsed in the previous round is tokenized
+def test_token_cache_tokenizes_new_loops_only(monkeypatch):
+    ast = netlist_to_ast(synth_defs(reps=12, body=3, nest=(4,)))
+    convert_to_debruijn(ast)
+    commands = len(ast.cmds)
+    tokenized = count_command_tokenizing(monkeypatch)
+    cache = TokenCache()
+    loop, ast = loop_id(ast, cache=cache)
+    assert len(tokenized) == commands and len(cache.ids) == commands
+    rounds = 1
+    while loop:
+        loop, ast = loop_id(ast, cache=cache)
+        assert len(cache.ids) == commands + rounds
+        rounds += 1
+    assert rounds > 2
+    assert len(tokenized) == commands
+
+# on an interned AST, shared expressions are tokenized once, to the same stream
+@pytest.mark.parametrize('bench', BENCHMARKS[::10])
+def test_interned_tokens_by_identity(bench, monkeypatch):
+    from main import block_to_ast  # main imports this module
+    ast = block_to_ast(defs=bench_defs(bench), intern=True)
+    tok, table = ast_to_token_ids(ast)
+    expressions = []
+    def counted(x, memo):
+        expressions.append(x)
+        return expression_tokens(x, memo)
+    monkeypatch.setattr(netlistToMaki, 'expression_tokens', counted)
+    for tokenize in (lambda: ast_to_token_ids(ast, interned=True),
+                     lambda: ast_to_token_ids(ast, cache=TokenCache(interned=True))):
+        del expressions[:]
+        shared, shared_table = tokenize()
+        assert [shared_table.decode(t) for t in shared] == [table.decode(t) for t in tok]
+        assert len(set(map(id, expressions))) == len(expressions)
+
+def written(ast, chunk=1 << 16):
+    f = io.StringIO()
+    write_maki(ast, f, chunk)
+    return f.getvalue()
+
+# the streamed writer matches str() on every kind of program the pipeline writes:
+# converted, De Bruijn indexed, with collapsed loops and rerolled (flat and nested)
+@pytest.mark.parametrize('bench', BENCHMARKS[::10] + ['synth'])
+def test_write_maki(bench):
+    defs = synth_defs(reps=4, body=3, nest=(4, 4), noise=0.1) if bench == 'synth' else bench_defs(bench)
+    ast = netlist_to_ast(defs)
+    programs = [ast]
+    ast = netlist_to_ast(defs)
+    convert_to_debruijn(ast)
+    programs.append(ast)
+    varMap = ir_to_racket(ast, 'test')
+    programs.append(reroll_loops(ast, find_loops(ast, varMap)))
+    programs.append(reroll_loops(ast, find_loop_hierarchy(ast, varMap)))
+    programs.append(loop_id(ast)[1])
+    for program in programs:
+        assert written(program) == str(program)
+        assert written(program, chunk=7) == str(program)
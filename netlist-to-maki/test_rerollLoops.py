@@ -0,0 +1,84 @@
+import os
+import pytest
+from netlistToMaki import netlist_to_ast, convert_to_debruijn, ir_to_racket, find_loops, find_loop_hierarchy, \
+    ForCmd, DefCmd, Wire, Var, WireExp, ValExp, WireSlice
+from rerollLoops import reroll_loops, debruijn_to_reg
+from test_netlistToMaki import HERE, bench_defs, synth_defs
+
+def rerolled(**spec):
+    ast = netlist_to_ast(synth_defs(**spec))
+    convert_to_debruijn(ast)
+    return reroll_loops(ast, find_loops(ast, ir_to_racket(ast, 'test')))
+
+# ForCmd has no lhs slot: loops are named through their body commands
+def test_debruijn_to_reg_with_loops():
+    prog = rerolled(reps=20, body=3)
+    loops = [c for c in prog.cmds if isinstance(c, ForCmd)]
+    assert loops
+    named = debruijn_to_reg(prog)
+    for i, c in enumerate(named.cmds):
+        if isinstance(c, ForCmd):
+            assert not hasattr(c, 'lhs')
+            assert [b.lhs for b in c.body.cmds if isinstance(b, DefCmd)] == ['{}.{}'.format(i, j) for j in range(3)]
+        else:
+            assert c.lhs == str(i)
+
+# (name, nested loops) of every loop of a rerolled program
+def loops_in(block, prefix=None):
+    found = []
+    for j, c in enumerate(block.cmds):
+        if isinstance(c, ForCmd):
+            name = '{}.{}'.format(prefix, j) if prefix is not None else str(j)
+            found.append((name, loops_in(c.body, name)))
+    return found
+
+# names read by an expression of a rerolled program
+def read_names(x):
+    if isinstance(x, (Wire, Var)):
+        return [str(x.name).replace('(& ', '').rstrip(')')]
+    if isinstance(x, (WireExp, ValExp)):
+        return [name for a in x.args for name in read_names(a)]
+    if isinstance(x, WireSlice):
+        return [name for h in x.vexps for name in read_names(h)]
+    return []
+
+# uses of loop body commands ('loop.body' names) that do not name an earlier command
+# of the same or an enclosing loop body
+def unresolved(block, prefix=None, visible=()):
+    visible = set(visible)
+    bad = []
+    for j, c in enumerate(block.cmds):
+        name = '{}.{}'.format(prefix, j) if prefix is not None else str(j)
+        if isinstance(c, ForCmd):
+            bad += unresolved(c.body, name, visible)
+        else:
+            bad += [(name, r) for r in read_names(c.rhs) if '.' in r and r not in visible]
+        visible.add(name)
+    return bad
+
+def test_reroll_nested_hierarchy():
+    ast = netlist_to_ast(bench_defs(os.path.join(HERE, 'basejump-netlists',
+        'bsg_reduce_segmented_and_p_1_segments_p_5_segment_width_p_32.blif')))
+    convert_to_debruijn(ast)
+    hierarchy = find_loop_hierarchy(ast, ir_to_racket(ast, 'test'))
+    assert [[l, r, [cl[1:3] for cl in children]] for _, l, r, children in hierarchy] == [[31, 4, [[1, 30]]]]
+    prog = reroll_loops(ast, hierarchy)
+    assert loops_in(prog) == [('6', [('6.3', [])])]
+    assert unresolved(prog) == []
+    outer = prog.cmds[6]
+    inner = outer.body.cmds[3]
+    assert (outer.index, outer.range, inner.index, inner.range) == ('i', 4, 'j', 30)
+    # the inner loop accumulates into a definition of the outer body, and the outer loop
+    # stores its last value through the inner loop's array
+    assert str(inner.body.cmds[0]) == '(6.1 (<<= (w& 6.1 (ws 0 (list j)))))'
+    assert str(outer.body.cmds[4]) == '(5 (<<= (array-store i (array-ref 6.2 29))))'
+
+@pytest.mark.parametrize('nest', [(4, 4), (3, 2, 2)])
+def test_reroll_nested_synthetic(nest):
+    ast = netlist_to_ast(synth_defs(reps=4, body=3, nest=nest))
+    convert_to_debruijn(ast)
+    hierarchy = find_loop_hierarchy(ast, ir_to_racket(ast, 'test'))
+    assert any(children for _, _, _, children in hierarchy)
+    prog = reroll_loops(ast, hierarchy)
+    assert any(nested for _, nested in loops_in(prog))
+    assert unresolved(prog) == []
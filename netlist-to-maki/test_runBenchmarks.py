@@ -0,0 +1,32 @@
+import time
+import runBenchmarks
+from runBenchmarks import run_all
+
+# Stands in for main.run_benchmark in the forked jobs; the BLIF name picks what the job does.
+def fake_benchmark(blif, clock, format, trace, *args):
+    with trace.phase('import'):
+        if blif == 'slow.blif':
+            time.sleep(60)
+        elif blif == 'oom.blif':
+            raise MemoryError()
+        elif blif == 'bad.blif':
+            raise ValueError('no such cell')
+    trace.set_count('loops_found', 3)
+    if blif == 'partial.blif':
+        trace.info['budget_exhausted'] = 'find_loops'
+
+# each way a job can end gets its status, and the summaries come back in the order of blifs
+def test_run_all_statuses(monkeypatch):
+    monkeypatch.setattr(runBenchmarks, 'run_benchmark', fake_benchmark)
+    blifs = ['ok.blif', 'slow.blif', 'oom.blif', 'bad.blif', 'partial.blif']
+    summaries = run_all(blifs, 'clk', '-pyrtl', jobs=len(blifs), timeout=2, mem_limit=0)
+    assert [s['blif'] for s in summaries] == blifs
+    assert [s['status'] for s in summaries] == ['ok', 'timeout', 'oom', 'error', 'partial']
+    for s in summaries:
+        assert {'blif', 'status', 'wall', 'phases', 'loops', 'error'} <= set(s)
+    ok, slow, oom, bad, partial = summaries
+    assert ok['loops'] == 3 and ok['error'] is None and 'import' in ok['phases']
+    assert slow['loops'] is None and slow['error'] == 'killed after 2s' and slow['wall'] >= 2
+    assert oom['loops'] is None and oom['error'] is None
+    assert bad['error'] == 'ValueError: no such cell'
+    assert partial['loops'] == 3
@@ -0,0 +1,110 @@
+import random
+from array import array
+import pytest
+import suffixarray
+from suffixarray import suffix_array, suffix_and_lcp_arrays, runs, runs_through, tandem_repeats_from_runs, \
+    runs_bounded
+
+ENGINES = ['naive', 'sais'] + (['numpy'] if suffixarray.np is not None else [])
+
+# Random int streams over small alphabets, some of them built from repeated bodies
+# so that they hold long runs; alphabets of ten or more ids catch orders that compare
+# the ids as strings.
+def random_streams(count, seed, max_len=60):
+    rnd = random.Random(seed)
+    streams = []
+    for _ in range(count):
+        k = rnd.choice([1, 2, 3, 5, 12, 30])
+        if rnd.random() < 0.5:
+            body = [rnd.randrange(k) for _ in range(rnd.randint(1, 6))]
+            s = []
+            while len(s) < max_len:
+                s += body * rnd.randint(1, 6) + [rnd.randrange(k) for _ in range(rnd.randint(0, 3))]
+            s = s[:rnd.randint(0, max_len)]
+        else:
+            s = [rnd.randrange(k) for _ in range(rnd.randint(0, max_len))]
+        streams.append(array('i', s))
+    return streams
+
+# All runs by definition: for every period, the maximal stretches where s[i] == s[i + p]
+# that cover at least one period, each interval kept with its smallest period.
+def brute_force_runs(s):
+    n = len(s)
+    found = {}
+    for p in range(1, n // 2 + 1):
+        i = 0
+        while i < n - p:
+            if s[i] != s[i + p]:
+                i += 1
+                continue
+            a = i
+            while i < n - p and s[i] == s[i + p]:
+                i += 1
+            if i - a >= p:
+                found.setdefault((a, i + p), p)
+    return sorted((a, b, p) for (a, b), p in found.items())
+
+def brute_force_lcp(s, sa):
+    lcp = []
+    for i, j in zip(sa, sa[1:] + [len(s)]):
+        k = 0
+        while i + k < len(s) and j + k < len(s) and s[i + k] == s[j + k]:
+            k += 1
+        lcp.append(k)
+    return lcp
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_suffix_array(engine):
+    for s in random_streams(300, 1):
+        expected = sorted(range(len(s)), key=lambda i: s[i:].tolist())
+        assert suffix_array(s, engine) == expected
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_lcp_array(engine):
+    for s in random_streams(300, 2):
+        sa, lcp = suffix_and_lcp_arrays(s, engine)
+        assert lcp == brute_force_lcp(s, sa)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_runs(engine):
+    for s in random_streams(500, 3):
+        assert runs(s, engine) == brute_force_runs(s)
+
+def test_runs_of_token_lists():
+    for s in random_streams(200, 4):
+        assert runs([('t', x) for x in s]) == brute_force_runs(s)
+
+def test_runs_through():
+    for s in random_streams(200, 5):
+        for q in range(0, len(s), 7):
+            expected = {r for r in brute_force_runs(s) if r[0] <= q < r[1]}
+            assert runs_through(s, q) == expected
+
+# the runs of at most max_period tokens, with NumPy and without
+@pytest.mark.parametrize('numpy', [False] + ([True] if suffixarray.np is not None else []))
+def test_runs_bounded(numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(suffixarray, 'np', None)
+    for s in random_streams(300, 7):
+        found = runs(s)
+        for max_period in (1, 2, 3, 7, 60):
+            expected = [r for r in found if r[2] <= max_period]
+            assert runs_bounded(s, max_period) == expected
+            assert runs_bounded([('t', x) for x in s], max_period) == expected
+
+def test_runs_through_bounded():
+    for s in random_streams(200, 8):
+        for q in range(0, len(s), 5):
+            for max_period in (1, 3, 8):
+                expected = {r for r in brute_force_runs(s) if r[0] <= q < r[1] and r[2] <= max_period}
+                assert runs_through(s, q, max_period) == expected
+
+# Every rotation of every run, by brute force: the candidate of a run is the one with the
+# most whole repeats, the latest one on ties.
+def test_tandem_repeats_from_runs():
+    for s in random_streams(300, 6):
+        found = runs(s)
+        for (a, b, p), (start, period, count) in zip(found, tandem_repeats_from_runs(found)):
+            best = max(((b - r) // p, r) for r in range(a, a + p))
+            assert (count, start, period) == best + (p,)
+            assert s[start:start + count * p].tolist() == s[start:start + p].tolist() * count